@@ -0,0 +1,135 @@
+"""Per-update CPU cost of NewMessage dispatch on a busy multi-channel feed.
+
+Feeds posts from many channels the bot is a member of (a few of them live
+sources) plus private messages from users, and measures CPU time per
+update for:
+  legacy   - both handlers run for every update, message_handler walking
+             its if-chain of modes after get_session (the previous code)
+  filtered - the registered builders, so Telethon's filter decides which
+             handlers run (private chats / live sources only)
+Run: python benchmarks/bench_dispatch.py [--updates 20000] [--channels 200]
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+os.environ.setdefault('RATE_LIMIT_INITIAL', '1000000')
+os.environ.setdefault('RATE_LIMIT_MAX', '1000000')
+os.environ.setdefault('RATE_LIMIT_CLIENT_MAX', '1000000')
+
+from common import load_bot
+from fake_telegram import FakeBackend, install, make_message
+
+bot = load_bot()
+
+# The modes message_handler compared one after another before the dispatch table
+LEGACY_CHAIN = (
+    ('awaiting_source',), ('awaiting_target', 'awaiting_add_target'), ('awaiting_range',),
+    ('awaiting_till_msg',), ('awaiting_till_file',), ('awaiting_phone',),
+    ('awaiting_session_string',), ('awaiting_auth_code',),
+)
+
+
+async def legacy_message_handler(event):
+    if not bot.is_admin(event.sender_id):
+        return
+    session = bot.get_session(event.sender_id)
+    for modes in LEGACY_CHAIN:
+        if session.mode in modes:
+            return
+
+
+async def legacy_live_handler(event):
+    if event.is_private:
+        return
+    if event.message.grouped_id:
+        return
+    await bot.dispatch_live(
+        event.chat_id, [event.message],
+        lambda client, target, messages, rules: bot.send_copy(client, target, messages[0], rules)
+    )
+
+
+def make_feed(updates, channels, users, first_id=1, seed=1):
+    """Channel posts spread evenly over the channels, with 5% private messages"""
+    rng = random.Random(seed)
+    chat_ids = [-1000000000000 - index for index in range(1, channels + 1)]
+    feed = []
+    for msg_id in range(first_id, first_id + updates):
+        message = make_message(msg_id, date=datetime.now(timezone.utc))
+        message.grouped_id = None
+        message.out = False
+        if rng.random() < 0.05:
+            user_id = rng.randint(1, users)
+            feed.append(SimpleNamespace(is_private=True, chat_id=user_id, sender_id=user_id, message=message))
+        else:
+            chat_id = rng.choice(chat_ids)
+            feed.append(SimpleNamespace(is_private=False, chat_id=chat_id, sender_id=chat_id, message=message))
+    return feed
+
+
+async def run(feed, handlers):
+    """CPU seconds per update for a list of (callback, filter) pairs"""
+    started = time.process_time()
+    for event in feed:
+        for callback, accepts in handlers:
+            if accepts(event):
+                await callback(event)
+    return (time.process_time() - started) / len(feed)
+
+
+async def main_async(args):
+    real_bot = bot.bot
+    backend = FakeBackend(history=2 * args.updates, latency=0)
+    install(bot, backend)
+
+    sources = [-1000000000000 - index for index in range(1, args.live_sources + 1)]
+    for user_id in range(1, args.users + 1):
+        session = bot.get_session(user_id)
+        session.source_channel = sources[user_id % len(sources)]
+        session.target_channels = [-1009000000000 - user_id]
+        session.mode = 'live' if user_id <= args.live_sessions else 'idle'
+        bot.update_live_route(session)
+
+    # The builders bot.py registered on its real client, with their filters
+    filtered = []
+    for callback, builder in real_bot.list_event_handlers():
+        if callback in (bot.message_handler, bot.live_forward_handler):
+            await builder.resolve(real_bot)
+            filtered.append((callback, builder.filter))
+    legacy = [(legacy_message_handler, lambda event: True), (legacy_live_handler, lambda event: True)]
+
+    # Separate message IDs per run, so the second run is not skipped as already forwarded
+    feeds = {
+        'legacy': make_feed(args.updates, args.channels, args.users),
+        'filtered': make_feed(args.updates, args.channels, args.users, first_id=args.updates + 1),
+    }
+    live_share = sum(1 for event in feeds['legacy'] if event.chat_id in bot.live_routes) / args.updates
+    print(f"{args.updates} updates from {args.channels} channels, {args.live_sources} live sources "
+          f"({live_share:.1%} of updates), {args.users} users")
+    print(f"{'dispatch':>10} {'other µs/update':>16} {'live source µs/update':>22} {'overall':>8}")
+    for name, handlers in (('legacy', legacy), ('filtered', filtered)):
+        other = [event for event in feeds[name] if event.chat_id not in bot.live_routes]
+        live = [event for event in feeds[name] if event.chat_id in bot.live_routes]
+        other_cost = await run(other, handlers)
+        live_cost = await run(live, handlers)
+        overall = (other_cost * len(other) + live_cost * len(live)) / args.updates
+        print(f"{name:>10} {other_cost * 1e6:>16.2f} {live_cost * 1e6:>22.2f} {overall * 1e6:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=20_000)
+    parser.add_argument('--channels', type=int, default=200, help="channels the bot receives posts from")
+    parser.add_argument('--live-sources', type=int, default=5, help="how many of them are live sources")
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--live-sessions', type=int, default=10)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Cold-start hydration time for a large settings database.
+
+Stores USERS sessions (a fifth of them in live mode), then measures a fresh
+hydrate_sessions() call as done at startup.
+Run: python benchmarks/bench_hydration.py [USERS]
+"""
+import sys
+import time
+
+from common import load_bot
+
+bot = load_bot()
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+
+
+def populate(count):
+    rows = []
+    for user_id in range(1, count + 1):
+        rows.append((user_id, {
+            'source_channel': -1000000000000 - (user_id % 5000),
+            'target_channels': [-1009999999999],
+            'mode': 'live' if user_id % 5 == 0 else 'idle',
+            'forward_count': user_id,
+            'user_phone': '+10000000000',
+            'session_string': 'x' * 350,
+        }))
+    bot.config_store.upsert_many(rows)
+
+
+def main():
+    start = time.perf_counter()
+    populate(USERS)
+    print(f"stored {USERS} users in {time.perf_counter() - start:.2f}s")
+
+    bot.user_sessions.clear()
+    bot.live_routes.clear()
+    start = time.perf_counter()
+    bot.hydrate_sessions()
+    elapsed = time.perf_counter() - start
+    live = sum(len(subscribers) for subscribers in bot.live_routes.values())
+    print(f"hydrated {len(bot.user_sessions)} sessions in {elapsed * 1000:.0f} ms "
+          f"({elapsed / USERS * 1e6:.1f} us/session, {live} live routes)")
+
+
+if __name__ == '__main__':
+    main()
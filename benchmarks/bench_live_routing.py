@@ -0,0 +1,85 @@
+"""Live-mode dispatch cost as the number of configured sessions grows.
+
+Compares the live_routes index against the previous linear scan over
+user_sessions. Run: python benchmarks/bench_live_routing.py
+"""
+import asyncio
+import os
+from types import SimpleNamespace
+
+os.environ.setdefault('RATE_LIMIT_INITIAL', '1000000')
+os.environ.setdefault('RATE_LIMIT_MAX', '1000000')
+os.environ.setdefault('RATE_LIMIT_CLIENT_MAX', '1000000')
+
+from common import load_bot, timeit
+
+bot = load_bot()
+
+SESSION_COUNTS = [10, 100, 1_000, 10_000, 100_000]
+EVENTS = 2_000
+
+
+async def _noop(*args, **kwargs):
+    return None
+
+
+async def _resolve(chat):
+    from telethon.tl.types import InputPeerChannel
+    return InputPeerChannel(abs(chat) % 10 ** 12, 1)
+
+
+def linear_scan(chat_id):
+    """The pre-index dispatch: check every session for every update"""
+    matches = 0
+    for user_id, session in bot.user_sessions.items():
+        if session.mode == 'live' and session.source_channel:
+            if chat_id == session.source_channel:
+                matches += 1
+    return matches
+
+
+def populate(count):
+    bot.user_sessions.clear()
+    bot.live_routes.clear()
+    for user_id in range(1, count + 1):
+        session = bot.UserSession(user_id)
+        session.source_channel = -1000000000000 - user_id
+        session.target_channels = [-1009999999999]
+        session.mode = 'live'
+        bot.user_sessions[user_id] = session
+        bot.update_live_route(session)
+
+
+async def run_dispatch(chat_id):
+    # A fresh message ID per event so the dedup index lets every one through
+    events = [
+        SimpleNamespace(
+            is_private=False,
+            chat_id=chat_id,
+            message=SimpleNamespace(id=msg_id, text='post', message='post', media=None, buttons=None,
+                                    entities=None, grouped_id=None),
+        )
+        for msg_id in range(1, EVENTS + 1)
+    ]
+    start = asyncio.get_running_loop().time()
+    for event in events:
+        await bot.live_forward_handler(event)
+    return (asyncio.get_running_loop().time() - start) / EVENTS
+
+
+def main():
+    # Isolate dispatch from network and disk
+    bot.bot.get_input_entity = _resolve
+    bot.bot.send_message = _noop
+
+    print(f"{'sessions':>10} {'unrelated (us)':>15} {'matched (us)':>13} {'linear scan (us)':>17}")
+    for count in SESSION_COUNTS:
+        populate(count)
+        unrelated = asyncio.run(run_dispatch(-1234))
+        matched = asyncio.run(run_dispatch(-1000000000001))
+        scan = timeit(lambda: linear_scan(-1234), max(1, EVENTS // max(1, count // 1000)))
+        print(f"{count:>10} {unrelated * 1e6:>15.2f} {matched * 1e6:>13.2f} {scan * 1e6:>17.2f}")
+
+
+if __name__ == '__main__':
+    main()
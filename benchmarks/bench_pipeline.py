@@ -0,0 +1,94 @@
+"""Bulk forwarding throughput: pipelined fetch/forward vs. the serial loop.
+
+A fake user client returns history pages of 100 messages after FETCH_MS and a
+fake bot forwards each batch after FORWARD_MS. The serial loop fetches and
+forwards strictly in turn, like the bulk forwarders did before pipelining.
+The fan-out line forwards every batch to FANOUT_TARGETS targets at once.
+Run: python benchmarks/bench_pipeline.py
+"""
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault('RATE_LIMIT_INITIAL', '1000000')
+os.environ.setdefault('RATE_LIMIT_MAX', '1000000')
+os.environ.setdefault('RATE_LIMIT_CLIENT_MAX', '1000000')
+
+from common import load_bot
+from telethon.tl.types import InputPeerChannel
+
+bot = load_bot()
+
+MESSAGES = 5_000
+FETCH_MS = 40
+FORWARD_MS = 60
+FANOUT_TARGETS = 5
+SOURCE = InputPeerChannel(1, 1)
+SOURCE_ID = -1000000000001
+TARGET_ID = -1000000000002
+
+
+async def history(count):
+    """Yield messages in pages of 100, each page costing FETCH_MS"""
+    for first in range(1, count + 1, 100):
+        await asyncio.sleep(FETCH_MS / 1000)
+        for msg_id in range(first, min(first + 100, count + 1)):
+            yield SimpleNamespace(id=msg_id, media=None)
+
+
+async def fake_forward(target, message_ids, source):
+    await asyncio.sleep(FORWARD_MS / 1000)
+    return [SimpleNamespace(id=msg_id) for msg_id in message_ids]
+
+
+async def resolve(chat):
+    return chat if isinstance(chat, InputPeerChannel) else InputPeerChannel(abs(chat) % 10**10, 2)
+
+
+async def serial(target):
+    batch = []
+    async for message in history(MESSAGES):
+        batch.append(message.id)
+        if len(batch) >= bot.FORWARD_BATCH_SIZE:
+            await bot.forward_batch(TARGET_ID, SOURCE_ID, batch)
+            batch = []
+    if batch:
+        await bot.forward_batch(TARGET_ID, SOURCE_ID, batch)
+
+
+async def pipelined(target):
+    job = bot.BulkJob(1, 'all', {})
+    await bot.forward_message_batches(job, SOURCE, [(TARGET_ID, target)], history(MESSAGES))
+
+
+async def fanned_out(target):
+    job = bot.BulkJob(1, 'all', {})
+    targets = [(-1000000000100 - index, target) for index in range(FANOUT_TARGETS)]
+    await bot.forward_message_batches(job, SOURCE, targets, history(MESSAGES))
+
+
+def measure(coro_func, target):
+    start = time.perf_counter()
+    asyncio.run(coro_func(target))
+    return MESSAGES / (time.perf_counter() - start)
+
+
+def main():
+    bot.bot.forward_messages = fake_forward
+    bot.bot.get_input_entity = resolve
+    target = InputPeerChannel(2, 2)
+
+    serial_rate = measure(serial, target)
+    pipelined_rate = measure(pipelined, target)
+    fanout_rate = measure(fanned_out, target)
+    print(f"messages={MESSAGES} fetch={FETCH_MS}ms/page forward={FORWARD_MS}ms/batch "
+          f"prefetch={bot.FORWARD_PREFETCH_BATCHES}")
+    print(f"serial:    {serial_rate:8.0f} msg/s")
+    print(f"pipelined: {pipelined_rate:8.0f} msg/s ({pipelined_rate / serial_rate:.2f}x)")
+    print(f"fan-out:   {fanout_rate:8.0f} msg/s to each of {FANOUT_TARGETS} targets "
+          f"(concurrency {bot.FANOUT_CONCURRENCY})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Cost per message of the /rules filter and caption rewrite.
+
+Compares CompiledRules against evaluating the same rules one by one per
+message (lowercasing the text for every keyword, re.search per regex and
+a str.replace per replacement), for growing numbers of keywords.
+Run: python benchmarks/bench_rules.py
+"""
+import random
+import re
+from types import SimpleNamespace
+
+from common import load_bot, timeit
+
+bot = load_bot()
+
+RULE_COUNTS = [5, 50, 500]
+MESSAGES = 2_000
+WORDS = "sale deal news update promo photo video channel today price offer free new limited".split()
+
+
+def make_messages(count):
+    rng = random.Random(1)
+    messages = []
+    for msg_id in range(count):
+        words = rng.choices(WORDS, k=30)
+        if msg_id % 7 == 0:
+            words.append("https://t.me/somechannel")
+        if msg_id % 5 == 0:
+            words.append("@someuser")
+        messages.append(SimpleNamespace(
+            id=msg_id, message=" ".join(words), entities=None, media=None, photo=None, document=None, file=None
+        ))
+    return messages
+
+
+def make_rules(count):
+    keywords = [f"kw{i}" for i in range(count)] + ['sale']
+    return {
+        'include': keywords,
+        'exclude': [f"spam{i}" for i in range(count)],
+        'regex': [r'\bprice\s+\w+'],
+        'links': 'block',
+        'strip': ['usernames'],
+        'replace': [[f"old{i}", f"new{i}"] for i in range(count)] + [['promo', 'offer']],
+    }
+
+
+def naive(rules, messages):
+    """Rule-by-rule evaluation with no precompilation"""
+    for message in messages:
+        text = message.message
+        if any(keyword.lower() in text.lower() for keyword in rules['exclude']):
+            continue
+        if not (any(keyword.lower() in text.lower() for keyword in rules['include'])
+                or any(re.search(pattern, text) for pattern in rules['regex'])):
+            continue
+        if re.search(bot.LINK_RE.pattern, text, re.IGNORECASE):
+            continue
+        text = re.sub(bot.USERNAME_RE.pattern, "", text)
+        for old, new in rules['replace']:
+            text = text.replace(old, new)
+
+
+def compiled(rules, messages):
+    for message in messages:
+        if rules.matches(message):
+            rules.caption(message)
+
+
+def main():
+    messages = make_messages(MESSAGES)
+    print(f"{MESSAGES} messages of ~30 words")
+    print(f"{'rules':>6} {'naive µs/msg':>13} {'compiled µs/msg':>16} {'speedup':>8}")
+    for count in RULE_COUNTS:
+        rules = make_rules(count)
+        compiled_rules = bot.CompiledRules(rules)
+        naive_seconds = timeit(lambda: naive(rules, messages), 3) / MESSAGES
+        compiled_seconds = timeit(lambda: compiled(compiled_rules, messages), 3) / MESSAGES
+        print(f"{count:>6} {naive_seconds * 1e6:>13.2f} {compiled_seconds * 1e6:>16.2f} "
+              f"{naive_seconds / compiled_seconds:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
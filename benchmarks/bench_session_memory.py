@@ -0,0 +1,99 @@
+"""Memory held by loaded user sessions.
+
+Compares UserSession (slots) against the same class with a per-instance
+__dict__ as before, per 100k sessions. Then stores USERS sessions (a fifth
+of them live), loads them all as a busy day would, lets evict_sessions()
+drop the idle ones and finally hydrates them as after a restart.
+Sizes are Python heap bytes measured with tracemalloc.
+Run: python benchmarks/bench_session_memory.py [USERS]
+"""
+import gc
+import sys
+import time
+import tracemalloc
+
+from common import load_bot
+
+bot = load_bot()
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+# The previous layout: identical attributes, stored in a per-instance __dict__
+LegacySession = type('LegacySession', (), {'__init__': bot.UserSession.__init__})
+
+
+def stored_config(user_id):
+    return {
+        'source_channel': -1000000000000 - (user_id % 5000),
+        'target_channels': [-1009999999999],
+        'mode': 'live' if user_id % 5 == 0 else 'idle',
+        'forward_count': user_id,
+        'target_stats': {},
+        'user_phone': '+10000000000',
+        'session_string': 'x' * 350,
+    }
+
+
+def heap_mb():
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0] / 2 ** 20
+
+
+def build_sessions(cls, count, settings):
+    sessions = []
+    for user_id in range(1, count + 1):
+        session = cls(user_id)
+        if settings:
+            config = stored_config(user_id)
+            session.source_channel = config['source_channel']
+            session.target_channels = config['target_channels']
+            session.mode = config['mode']
+            session.forward_count = config['forward_count']
+            session.user_phone = config['user_phone']
+            session.session_string = config['session_string']
+        sessions.append(session)
+    return sessions
+
+
+def main():
+    tracemalloc.start()
+    count = min(USERS, 100_000)
+    scale = 100_000 / count
+    print("Per 100k sessions")
+    print(f"{'layout':>20} {'bare MB':>8} {'with settings MB':>17}")
+    for name, cls in (('__dict__ (before)', LegacySession), ('__slots__', bot.UserSession)):
+        sizes = []
+        for settings in (False, True):
+            before = heap_mb()
+            sessions = build_sessions(cls, count, settings)
+            sizes.append((heap_mb() - before) * scale)
+            del sessions
+        print(f"{name:>20} {sizes[0]:>8.1f} {sizes[1]:>17.1f}")
+
+    bot.config_store.upsert_many([(user_id, stored_config(user_id)) for user_id in range(1, USERS + 1)])
+    bot.user_sessions.clear()
+    bot.live_routes.clear()
+    baseline = heap_mb()
+
+    print(f"\n{USERS} stored users, {USERS // 5} of them live")
+    for user_id in range(1, USERS + 1):
+        bot.get_session(user_id)
+    print(f"{'all loaded':>20} {heap_mb() - baseline:>8.1f} MB  ({len(bot.user_sessions)} sessions)")
+
+    started = time.perf_counter()
+    evicted = bot.evict_sessions(idle_timeout=0)
+    elapsed = time.perf_counter() - started
+    print(f"{'after eviction':>20} {heap_mb() - baseline:>8.1f} MB  ({len(bot.user_sessions)} sessions, "
+          f"{evicted} evicted in {elapsed * 1000:.0f} ms)")
+
+    bot.user_sessions.clear()
+    bot.live_routes.clear()
+    started = time.perf_counter()
+    bot.hydrate_sessions()
+    elapsed = time.perf_counter() - started
+    print(f"{'after restart':>20} {heap_mb() - baseline:>8.1f} MB  ({len(bot.user_sessions)} sessions, "
+          f"hydrated in {elapsed * 1000:.0f} ms)")
+
+
+if __name__ == '__main__':
+    main()
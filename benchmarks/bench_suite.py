@@ -0,0 +1,260 @@
+"""End-to-end benchmark suite against a fake Telegram backend.
+
+Drives forward_all_messages, forward_message_range, forward_files, a range
+copied from a source with forwarding restricted, live dispatch and
+save_session with every TelegramClient replaced by the
+stand-in from fake_telegram.py, and reports per scenario:
+messages/sec, API calls per message, peak traced memory and event-loop lag.
+
+With --baseline, exits non-zero when a scenario makes more API calls per
+message than the baseline, or when its lag ratio (lag p99 over the time a
+fixed CPU workload takes on this machine) grows beyond --tolerance. Both
+hold across machines; msgs/sec is printed next to the baseline for
+information only.
+Run: python benchmarks/bench_suite.py [--messages 10000] [--json out.json] [--baseline benchmarks/baseline.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+os.environ.setdefault('RATE_LIMIT_INITIAL', '1000000')
+os.environ.setdefault('RATE_LIMIT_MAX', '1000000')
+os.environ.setdefault('RATE_LIMIT_CLIENT_MAX', '1000000')
+os.environ.setdefault('PROGRESS_EDIT_INTERVAL', '1')
+
+from common import load_bot
+from fake_telegram import FakeBackend, install, make_message
+
+INVOKED_FROM = os.getcwd()  # load_bot() moves to a scratch directory
+bot = load_bot()
+
+SOURCE = -1000000000001
+LIVE_SESSIONS = 10
+LAG_FLOOR_MS = 20.0  # Stalls shorter than this never count as a regression
+
+
+def reference_ms():
+    """Time a fixed serialize-heavy workload so lag can be compared across machines"""
+    record = {'user_id': 1, 'targets': list(range(-1000000000100, -1000000000090)), 'mode': 'live'}
+    best = float('inf')
+    for _ in range(10):
+        started = time.perf_counter()
+        for _ in range(200):
+            json.loads(json.dumps(record))
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+class LagMonitor:
+    """Samples how late the event loop wakes a task that sleeps for `interval`"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = []
+        self.task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(loop.time() - started - self.interval)
+
+    async def __aenter__(self):
+        self.samples = []
+        self.task = asyncio.create_task(self._run())
+        await asyncio.sleep(0)  # Start sampling before the scenario runs
+        return self
+
+    async def __aexit__(self, *exc):
+        self.task.cancel()
+
+    def stats(self):
+        ordered = sorted(self.samples) or [0.0]
+        return {
+            'lag_p99_ms': ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))] * 1000,
+            'lag_max_ms': ordered[-1] * 1000,
+        }
+
+
+def make_user(user_id, targets, mode='idle'):
+    session = bot.get_session(user_id)
+    session.source_channel = SOURCE
+    session.target_channels = list(targets)
+    session.user_phone = '+10000000000'
+    session.session_string = ''
+    session.mode = mode
+    bot.update_live_route(session)
+    return session
+
+
+async def measure(backend, name, run):
+    """Run one scenario and collect its figures; run() returns the messages it delivered"""
+    calls = backend.api_calls()
+    errors = len(backend.errors)
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    async with LagMonitor() as lag:
+        delivered = await run()
+        elapsed = time.perf_counter() - started
+        await asyncio.sleep(lag.interval * 2)  # Let the monitor record a loop blocked until now
+    if len(backend.errors) > errors:
+        raise RuntimeError(f"{name}: bot reported {backend.errors[errors:]}")
+    result = {
+        'messages': delivered,
+        'seconds': elapsed,
+        'msgs_per_sec': delivered / elapsed if elapsed > 0 else 0.0,
+        'api_calls_per_msg': (backend.api_calls() - calls) / max(1, delivered),
+        'peak_mb': tracemalloc.get_traced_memory()[1] / 2 ** 20,
+    }
+    result.update(lag.stats())
+    return result
+
+
+async def run_suite(args):
+    backend = FakeBackend(
+        history=args.messages, latency=args.latency_ms / 1000,
+        flood_every=args.flood_every, flood_seconds=args.flood_seconds
+    )
+    install(bot, backend)
+    results = {}
+    reference = reference_ms()
+
+    async def forward_all():
+        make_user(1, [-1000000000101])
+        before = backend.forwarded
+        await bot.forward_all_messages(1)
+        return backend.forwarded - before
+
+    async def forward_range():
+        make_user(2, [-1000000000201, -1000000000202])
+        before = backend.forwarded
+        await bot.forward_message_range(2, args.messages // 4, 3 * args.messages // 4)
+        return backend.forwarded - before
+
+    async def forward_files():
+        make_user(3, [-1000000000301])
+        before = backend.forwarded
+        await bot.forward_files(3, 0, media_type='photo')
+        return backend.forwarded - before
+
+    async def copy_protected():
+        make_user(4, [-1000000000401, -1000000000402])
+        backend.protected = True
+        before = backend.forwarded
+        transferred = backend.bytes_down + backend.bytes_up
+        try:
+            await bot.forward_message_range(4, 1, args.copy_messages)
+        finally:
+            backend.protected = False
+        copied_bytes[0] = backend.bytes_down + backend.bytes_up - transferred
+        return backend.forwarded - before
+
+    copied_bytes = [0]
+
+    async def live():
+        for user_id in range(100, 100 + LIVE_SESSIONS):
+            make_user(user_id, [-1000000001000 - user_id], mode='live')
+        before = backend.forwarded
+        for msg_id in range(1, args.live_events + 1):
+            message = make_message(msg_id, date=datetime.now(timezone.utc))
+            message.grouped_id = None
+            await bot.live_forward_handler(SimpleNamespace(is_private=False, chat_id=SOURCE, message=message))
+        return backend.forwarded - before
+
+    async def save_sessions():
+        for user_id in range(10_000, 10_000 + args.saves):
+            make_user(user_id, [-1000000000401])
+        for user_id in range(10_000, 10_000 + args.saves):
+            bot.save_session(user_id)
+        return args.saves
+
+    for name, run in (
+        ('forward_all', forward_all), ('forward_range', forward_range), ('forward_files', forward_files),
+        ('copy_protected', copy_protected), ('live', live), ('save_session', save_sessions)
+    ):
+        results[name] = await measure(backend, name, run)
+        results[name]['lag_ratio'] = results[name]['lag_p99_ms'] / reference
+    results['copy_protected']['mb_per_sec'] = copied_bytes[0] / 2 ** 20 / results['copy_protected']['seconds']
+    results['_backend'] = {
+        'api_calls': dict(backend.calls), 'flood_waits': backend.floods, 'reference_ms': reference
+    }
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return (regressions, throughput notes) against a baseline results file"""
+    problems = []
+    notes = []
+    for name, expected in baseline.items():
+        if name.startswith('_') or name not in results:
+            continue
+        actual = results[name]
+        if actual['api_calls_per_msg'] > expected['api_calls_per_msg'] * 1.05 + 0.001:
+            problems.append(
+                f"{name}: {actual['api_calls_per_msg']:.4f} API calls/msg, baseline {expected['api_calls_per_msg']:.4f}"
+            )
+        if ('lag_ratio' in expected and actual['lag_p99_ms'] > LAG_FLOOR_MS
+                and actual['lag_ratio'] > expected['lag_ratio'] * (1 + tolerance)):
+            problems.append(
+                f"{name}: lag ratio {actual['lag_ratio']:.1f}, baseline {expected['lag_ratio']:.1f}"
+            )
+        if expected['msgs_per_sec'] > 0:
+            change = actual['msgs_per_sec'] / expected['msgs_per_sec'] - 1
+            notes.append(f"{name}: {actual['msgs_per_sec']:.0f} msg/s, baseline {expected['msgs_per_sec']:.0f} ({change:+.0%})")
+    return problems, notes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=10_000, help="synthetic channel history size")
+    parser.add_argument('--live-events', type=int, default=200, help="live posts dispatched")
+    parser.add_argument('--saves', type=int, default=5_000, help="sessions saved")
+    parser.add_argument('--copy-messages', type=int, default=500, help="messages copied from a protected source")
+    parser.add_argument('--latency-ms', type=float, default=5.0, help="fake latency per API call")
+    parser.add_argument('--flood-every', type=int, default=0, help="inject a flood wait every N sends")
+    parser.add_argument('--flood-seconds', type=int, default=1, help="length of injected flood waits")
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--baseline', help="compare against this results file")
+    parser.add_argument('--tolerance', type=float, default=2.0, help="allowed lag ratio growth vs. baseline")
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    results = asyncio.run(run_suite(args))
+
+    print(f"history={args.messages} latency={args.latency_ms}ms/call flood_every={args.flood_every}")
+    print(f"{'scenario':>14} {'messages':>9} {'msg/s':>9} {'calls/msg':>10} {'peak MB':>8} "
+          f"{'lag p99':>8} {'lag max':>8} {'lag ratio':>9}")
+    for name, result in results.items():
+        if name.startswith('_'):
+            continue
+        print(f"{name:>14} {result['messages']:>9} {result['msgs_per_sec']:>9.0f} "
+              f"{result['api_calls_per_msg']:>10.4f} {result['peak_mb']:>8.1f} "
+              f"{result['lag_p99_ms']:>6.1f}ms {result['lag_max_ms']:>6.1f}ms {result['lag_ratio']:>9.1f}")
+    print(f"copy_protected moved {results['copy_protected']['mb_per_sec']:.0f} MB/s (download + upload)")
+    print(f"API calls: {results['_backend']['api_calls']}")
+    print(f"lag ratio = lag p99 / {results['_backend']['reference_ms']:.1f}ms reference workload")
+
+    if args.json:
+        with open(os.path.join(INVOKED_FROM, args.json), 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(os.path.join(INVOKED_FROM, args.baseline)) as f:
+            problems, notes = compare(results, json.load(f), args.tolerance)
+        for note in notes:
+            print(f"info {note}")
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
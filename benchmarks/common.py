@@ -0,0 +1,31 @@
+"""Shared helpers for the offline benchmarks.
+
+bot.py creates its TelegramClient at import time, so the benchmarks give it
+dummy credentials and run from a scratch directory (the client creates a
+session file and the bot writes config.json in the working directory).
+"""
+import os
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_bot():
+    """Import bot.py with dummy credentials inside a temporary directory"""
+    os.environ.setdefault('API_ID', '1')
+    os.environ.setdefault('API_HASH', 'benchmark')
+    os.chdir(tempfile.mkdtemp(prefix='fwd-bench-'))
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    import bot
+    return bot
+
+
+def timeit(func, repeat):
+    """Return mean seconds per call of func over repeat calls"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
@@ -0,0 +1,289 @@
+"""In-process stand-in for Telethon's TelegramClient used by the benchmark suite.
+
+Every client shares one FakeBackend, which holds the synthetic channel
+history, the per-call latency, flood-wait injection and call counters.
+Histories are generated on the fly from message IDs, so a 1M message
+channel costs no memory until it is iterated.
+"""
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from telethon.errors import ChatForwardsRestrictedError, FileReferenceExpiredError, FloodWaitError
+from telethon.tl.types import (
+    Document, InputMediaDocument, InputMediaPhoto, InputMediaUploadedDocument, InputMediaUploadedPhoto,
+    InputMessagesFilterDocument, InputMessagesFilterPhotos, InputMessagesFilterPhotoVideo, InputMessagesFilterVideo,
+    InputPeerChannel, InputPeerUser, MessageMediaDocument, MessageMediaPhoto, Photo
+)
+
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+PAGE_SIZE = 100  # Messages per GetHistory/Search call, as Telethon requests them
+
+FILTER_KINDS = {
+    InputMessagesFilterPhotos: ('photo',),
+    InputMessagesFilterVideo: ('video',),
+    InputMessagesFilterDocument: ('document',),
+    InputMessagesFilterPhotoVideo: ('photo', 'video'),
+}
+FILE_SIZES = {'photo': 200_000, 'video': 20_000_000, 'document': 2_000_000}
+FILE_TYPES = {'photo': ('.jpg', 'image/jpeg'), 'video': ('.mp4', 'video/mp4'), 'document': ('.pdf', 'application/pdf')}
+
+
+def media_kind(msg_id):
+    """Deterministic media layout: a 3-photo album every 100 messages, plus single photos, videos and files"""
+    if msg_id % 100 in (0, 1, 2) or msg_id % 10 == 5:
+        return 'photo'
+    if msg_id % 20 == 3:
+        return 'video'
+    if msg_id % 10 == 7:
+        return 'document'
+    return None
+
+
+def make_message(msg_id, date=None):
+    kind = media_kind(msg_id)
+    media = None
+    if kind == 'photo':
+        media = MessageMediaPhoto(photo=Photo(msg_id, 1, b'1', EPOCH, [], 1))
+    elif kind:
+        media = MessageMediaDocument(document=Document(msg_id, 1, b'1', EPOCH, FILE_TYPES[kind][1], FILE_SIZES[kind], 1, []))
+    file = SimpleNamespace(size=FILE_SIZES[kind], name=None, ext=FILE_TYPES[kind][0]) if kind else None
+    return SimpleNamespace(
+        id=msg_id,
+        date=date or EPOCH + timedelta(seconds=msg_id),
+        message=f"post {msg_id}",
+        text=f"post {msg_id}",
+        entities=None,
+        buttons=None,
+        media=media,
+        file=file,
+        photo=media.photo if kind == 'photo' else None,
+        document=media.document if kind in ('video', 'document') else None,
+        grouped_id=msg_id // 100 + 1 if msg_id % 100 in (0, 1, 2) else None,
+    )
+
+
+class TotalList(list):
+    total = None
+
+
+class FakeSentMessage:
+    def __init__(self, backend, msg_id=1, media=None):
+        self.backend = backend
+        self.id = msg_id
+        self.media = media
+
+    async def edit(self, text):
+        await self.backend.call('edit_message')
+        return self
+
+
+class FakeBackend:
+    """Shared state of all fake clients"""
+
+    def __init__(self, history=10_000, latency=0.005, flood_every=0, flood_seconds=1, protected=False):
+        self.history = history
+        self.protected = protected  # The source restricts forwarding, like a channel with content protection
+        self.latency = latency
+        self.flood_every = flood_every  # Every Nth send raises FloodWaitError; 0 disables
+        self.flood_seconds = flood_seconds
+        self.calls = Counter()
+        self.sends = 0
+        self.forwarded = 0
+        self.floods = 0
+        self.errors = []  # Error texts the bot sent to users
+        self.bytes_down = 0
+        self.bytes_up = 0
+        self.file_reference = b'1'  # Bumped by expire_references()
+        self.sent_media = {}  # Sent message ID -> (photo?, server media ID)
+        self.next_id = 10 ** 9
+
+    def expire_references(self):
+        """Invalidate every file reference handed out so far, as Telegram does after a while"""
+        self.file_reference = str(int(self.file_reference) + 1).encode()
+
+    def media(self, msg_id):
+        """A sent message's media with the current file reference"""
+        return self.make_media(*self.sent_media[msg_id])
+    
+    def make_media(self, photo, media_id):
+        if photo:
+            return MessageMediaPhoto(photo=Photo(media_id, 1, self.file_reference, EPOCH, [], 1))
+        return MessageMediaDocument(document=Document(
+            media_id, 1, self.file_reference, EPOCH, 'application/octet-stream', 0, 1, []
+        ))
+
+    async def call(self, method):
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def send(self, method, count):
+        """A call that delivers count messages and may be answered with a flood wait"""
+        await self.call(method)
+        self.sends += 1
+        if self.flood_every and self.sends % self.flood_every == 0:
+            self.floods += 1
+            raise FloodWaitError(request=None, capture=self.flood_seconds)
+        self.forwarded += count
+
+    def client(self, *args, **kwargs):
+        """Factory with TelegramClient's signature"""
+        return FakeTelegramClient(self)
+
+    def expired(self, media):
+        """Whether an InputMedia sent by ID carries an outdated file reference"""
+        return isinstance(media, (InputMediaPhoto, InputMediaDocument)) and media.id.file_reference != self.file_reference
+    
+    def api_calls(self):
+        return sum(self.calls.values())
+
+
+class FakeTelegramClient:
+    def __init__(self, backend):
+        self.backend = backend
+        self.connected = False
+        self.session = SimpleNamespace(save=lambda: 'fake-session')
+
+    # Connection and account
+    def is_connected(self):
+        return self.connected
+
+    async def connect(self):
+        await self.backend.call('connect')
+        self.connected = True
+
+    async def disconnect(self):
+        self.connected = False
+
+    async def is_user_authorized(self):
+        return True
+
+    async def get_me(self, input_peer=False):
+        await self.backend.call('get_me')
+        return InputPeerUser(1, 1)
+
+    async def get_input_entity(self, chat):
+        await self.backend.call('resolve')
+        if isinstance(chat, InputPeerChannel):
+            return chat
+        return InputPeerChannel(abs(int(chat)) % 10 ** 12, 1)
+
+    async def get_permissions(self, channel, user):
+        await self.backend.call('get_permissions')
+        return SimpleNamespace(is_admin=True)
+
+    # History
+    async def get_messages(self, chat, limit=1, filter=None, ids=None):
+        """Newest messages first, with .total like Telethon's TotalList; one message for ids=N"""
+        await self.backend.call('get_messages')
+        if ids is not None:
+            if ids in self.backend.sent_media:
+                return SimpleNamespace(id=ids, media=self.backend.media(ids))
+            return make_message(ids) if 0 < ids <= self.backend.history else None
+        kinds = FILTER_KINDS.get(filter) if filter else None
+        result = TotalList()
+        for msg_id in range(self.backend.history, 0, -1):
+            if len(result) >= limit:
+                break
+            if kinds is None or media_kind(msg_id) in kinds:
+                message = make_message(msg_id)
+                message.chat = SimpleNamespace(noforwards=self.backend.protected)  # Sent along with the history
+                result.append(message)
+        result.total = self.backend.history if kinds is None else None
+        return result
+
+    async def iter_messages(self, chat, min_id=0, max_id=None, reverse=False, filter=None, limit=None):
+        last = min(max_id - 1, self.backend.history) if max_id else self.backend.history
+        kinds = FILTER_KINDS.get(filter) if filter else None
+        yielded = 0
+        page = 0
+        for msg_id in range(min_id + 1, last + 1):
+            if filter is not None and media_kind(msg_id) not in (kinds or ()):
+                continue
+            if page == 0:
+                await self.backend.call('get_history')
+            page = (page + 1) % PAGE_SIZE
+            yield make_message(msg_id)
+            yielded += 1
+            if limit is not None and yielded >= limit:
+                return
+
+    # Files
+    async def download_media(self, message, file=None):
+        await self.backend.call('get_file')
+        self.backend.bytes_down += message.file.size
+        return bytes(message.file.size)
+
+    async def iter_download(self, document, offset=0, limit=None, request_size=512 * 1024, file_size=None):
+        """Chunks of request_size from offset, one GetFile call each"""
+        end = file_size if limit is None else min(file_size, offset + limit * request_size)
+        while offset < end:
+            await self.backend.call('get_file')
+            chunk = min(request_size, end - offset)
+            self.backend.bytes_down += chunk
+            yield bytes(chunk)
+            offset += chunk
+
+    # Sending
+    async def forward_messages(self, entity, messages, from_peer=None):
+        if self.backend.protected:
+            await self.backend.call('forward_messages')
+            raise ChatForwardsRestrictedError(request=None)
+        await self.backend.send('forward_messages', len(messages))
+        return [SimpleNamespace(id=msg_id) for msg_id in messages]
+
+    async def send_message(self, entity, message='', file=None, **kwargs):
+        if isinstance(entity, int):
+            # A notice to a user rather than a copy to a channel
+            await self.backend.call('send_notice')
+            if str(message).startswith('❌'):
+                self.backend.errors.append(message)
+            return FakeSentMessage(self.backend)
+        if self.backend.expired(file):
+            await self.backend.call('send_message')
+            raise FileReferenceExpiredError(request=None)
+        await self.backend.send('send_message', 1)
+        if not isinstance(file, (InputMediaPhoto, InputMediaDocument, InputMediaUploadedPhoto, InputMediaUploadedDocument)):
+            return FakeSentMessage(self.backend)
+        # Media sent by ID keeps its ID; an upload gets a new one
+        self.backend.next_id += 1
+        photo = isinstance(file, (InputMediaPhoto, InputMediaUploadedPhoto))
+        media_id = file.id.id if isinstance(file, (InputMediaPhoto, InputMediaDocument)) else self.backend.next_id
+        self.backend.sent_media[self.backend.next_id] = (photo, media_id)
+        return FakeSentMessage(self.backend, self.backend.next_id, self.backend.media(self.backend.next_id))
+
+    async def __call__(self, request):
+        if type(request).__name__ == 'GetSearchCountersRequest':
+            await self.backend.call('get_search_counters')
+            counts = Counter(media_kind(msg_id) for msg_id in range(1, self.backend.history + 1))
+            return [
+                SimpleNamespace(count=sum(counts[kind] for kind in FILTER_KINDS.get(type(f), ())))
+                for f in request.filters
+            ]
+        if type(request).__name__ in ('SaveFilePartRequest', 'SaveBigFilePartRequest'):
+            await self.backend.call('save_file_part')
+            self.backend.bytes_up += len(request.bytes)
+            return True
+        if type(request).__name__ == 'UploadMediaRequest':
+            # An uploaded file turned into a photo or document that can be sent by ID
+            await self.backend.call('upload_media')
+            self.backend.next_id += 1
+            return self.backend.make_media(isinstance(request.media, InputMediaUploadedPhoto), self.backend.next_id)
+        media = getattr(request, 'multi_media', None)
+        if media and any(self.backend.expired(single.media) for single in media):
+            await self.backend.call(type(request).__name__)
+            raise FileReferenceExpiredError(request=None)
+        await self.backend.send(type(request).__name__, len(media) if media else 1)
+        return SimpleNamespace()
+
+
+def install(bot, backend):
+    """Point bot.py's clients at the fake backend"""
+    client = backend.client()
+    client.connected = True
+    bot.TelegramClient = backend.client
+    bot.bot = client
+    bot.sender_bots[0].client = client
+    return client
@@ -1,14 +1,37 @@
 import os
 import asyncio
-from telethon import TelegramClient, events, Button
+from telethon import TelegramClient, events, Button, utils, helpers
 from telethon.sessions import StringSession
-from telethon.tl.types import InputPeerChannel
-from telethon.errors import FloodWaitError, ChannelPrivateError
+from telethon.tl.functions.messages import GetSearchCountersRequest, SendMultiMediaRequest, UploadMediaRequest
+from telethon.tl.functions.upload import SaveBigFilePartRequest, SaveFilePartRequest
+from telethon.tl.types import (
+    InputFile, InputFileBig, InputMediaUploadedDocument, InputMediaUploadedPhoto, MessageMediaDocument,
+    MessageMediaPhoto, MessageMediaWebPage, MessageEntityUrl, MessageEntityTextUrl, InputPeerChannel, InputSingleMedia, InputMessagesFilterPhotos, InputMessagesFilterVideo, InputMessagesFilterDocument,
+    InputMessagesFilterMusic, InputMessagesFilterVoice, InputMessagesFilterGif, InputMessagesFilterRoundVideo,
+    InputMessagesFilterPhotoVideo
+)
+from telethon.errors import (
+    ChatForwardsRestrictedError, FloodWaitError, ChannelPrivateError, ChannelInvalidError, ChatWriteForbiddenError,
+    FileIdInvalidError, FilePartMissingError, FilePartsInvalidError, FileReferenceEmptyError,
+    FileReferenceExpiredError, FileReferenceInvalidError, MediaEmptyError,
+    ChatAdminRequiredError, PeerIdInvalidError, UserBannedInChannelError
+)
 import logging
+import bisect
+import hashlib
+import heapq
+import importlib.util
 import json
+import re
+import signal
+import sqlite3
+import time
+from collections import OrderedDict, deque
 from datetime import datetime
 from aiohttp import web
 
+HAS_CRYPTG = importlib.util.find_spec('cryptg') is not None  # Telethon decrypts downloads with it when installed
+
 # Configure logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -20,80 +43,1421 @@ logger = logging.getLogger(__name__)
 API_ID = os.environ.get('API_ID')
 API_HASH = os.environ.get('API_HASH')
 BOT_TOKEN = os.environ.get('BOT_TOKEN')
+# Extra bot tokens that share the sending load; each bot must be admin in the channels
+EXTRA_BOT_TOKENS = [x.strip() for x in os.environ.get('EXTRA_BOT_TOKENS', '').split(',') if x.strip()]
 ADMIN_IDS = [int(x) for x in os.environ.get('ADMIN_IDS', '').split(',') if x]
 
+# Bulk forwarding: number of message IDs sent per forward request (Telegram allows up to 100)
+FORWARD_BATCH_SIZE = max(1, min(100, int(os.environ.get('FORWARD_BATCH_SIZE', '100'))))
+# Bulk forwarding: batches fetched ahead of the one being forwarded
+FORWARD_PREFETCH_BATCHES = max(1, int(os.environ.get('FORWARD_PREFETCH_BATCHES', '4')))
+
+# Copy mode for sources with forwarding restricted: media is downloaded by the user
+# client and re-uploaded by the bot. Files up to BIG_FILE_SIZE are held in memory whole,
+# bigger documents are streamed part by part. COPY_BUFFER_MB (at least 16) bounds the
+# bytes held by all transfers together, COPY_CONCURRENCY is how many messages are
+# downloaded ahead per job, and each file moves in COPY_CHUNK_KB parts over
+# COPY_CHUNK_WORKERS parallel requests. Telegram only accepts parts that divide 512 KB (uploads) and
+# 1 MB (downloads), so the part size is rounded down to a power of two in 4-512 KB.
+COPY_BUFFER_BYTES = int(max(16.0, float(os.environ.get('COPY_BUFFER_MB', '256'))) * 2 ** 20)
+COPY_CONCURRENCY = max(1, int(os.environ.get('COPY_CONCURRENCY', '3')))
+COPY_CHUNK_SIZE = 1 << (max(4, min(512, int(os.environ.get('COPY_CHUNK_KB', '512')))).bit_length() - 1 + 10)
+COPY_CHUNK_WORKERS = max(1, int(os.environ.get('COPY_CHUNK_WORKERS', '4')))
+BIG_FILE_SIZE = 10 * 2 ** 20  # Larger uploads must use SaveBigFilePartRequest
+UPLOAD_MAX_PARTS = 3000  # Parts Telegram accepts per uploaded file (4000 with Premium)
+# Copy mode: uploaded photos/documents remembered per bot token for reuse (LRU entries)
+MEDIA_CACHE_SIZE = int(os.environ.get('MEDIA_CACHE_SIZE', '10000'))
+
+# Fan-out: target channels per user, and targets delivered to at the same time
+MAX_TARGETS = int(os.environ.get('MAX_TARGETS', '20'))
+FANOUT_CONCURRENCY = max(1, int(os.environ.get('FANOUT_CONCURRENCY', '5')))
+
+# Resolved chat cache: seconds before an entry is refreshed, and max entries kept
+ENTITY_CACHE_TTL = int(os.environ.get('ENTITY_CACHE_TTL', '3600'))
+ENTITY_CACHE_SIZE = int(os.environ.get('ENTITY_CACHE_SIZE', '10000'))
+
+# Per-user fetch clients: max kept connected, seconds idle before disconnecting,
+# and the first/max delay after a failed connect
+CLIENT_POOL_SIZE = max(1, int(os.environ.get('CLIENT_POOL_SIZE', '50')))
+CLIENT_IDLE_TIMEOUT = float(os.environ.get('CLIENT_IDLE_TIMEOUT', '900'))
+CLIENT_RECONNECT_BACKOFF = float(os.environ.get('CLIENT_RECONNECT_BACKOFF', '2'))
+CLIENT_RECONNECT_BACKOFF_MAX = float(os.environ.get('CLIENT_RECONNECT_BACKOFF_MAX', '300'))
+
+# Session cache: idle sessions unused for SESSION_IDLE_TIMEOUT seconds, or beyond
+# SESSION_CACHE_SIZE, are dropped from memory and reloaded from the store on demand.
+# Live sessions and sessions with a job or pending input stay loaded.
+SESSION_IDLE_TIMEOUT = float(os.environ.get('SESSION_IDLE_TIMEOUT', '1800'))
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', '10000'))
+
+# Adaptive rate limiting (requests/second). Each destination chat and each client
+# starts at RATE_LIMIT_INITIAL, ramps up additively while calls succeed and halves
+# on every flood wait.
+RATE_LIMIT_INITIAL = float(os.environ.get('RATE_LIMIT_INITIAL', '1'))
+RATE_LIMIT_MIN = float(os.environ.get('RATE_LIMIT_MIN', '0.05'))
+RATE_LIMIT_MAX = float(os.environ.get('RATE_LIMIT_MAX', '20'))
+RATE_LIMIT_CLIENT_MAX = float(os.environ.get('RATE_LIMIT_CLIENT_MAX', '30'))
+RATE_LIMIT_STEP = float(os.environ.get('RATE_LIMIT_STEP', '0.1'))
+
+# Media types Telegram can filter server-side: key -> (button label, search filter)
+MEDIA_FILTERS = {
+    'photo': ("🖼 Photos", InputMessagesFilterPhotos),
+    'video': ("🎬 Videos", InputMessagesFilterVideo),
+    'document': ("📄 Documents", InputMessagesFilterDocument),
+    'audio': ("🎵 Audio", InputMessagesFilterMusic),
+    'voice': ("🎤 Voice Messages", InputMessagesFilterVoice),
+    'gif': ("🎞 GIFs", InputMessagesFilterGif),
+    'round': ("⭕ Video Messages", InputMessagesFilterRoundVideo),
+}
+
+# Errors that mean a cached chat is no longer usable as-is
+ENTITY_ERRORS = (
+    ChannelPrivateError, ChannelInvalidError, ChatWriteForbiddenError,
+    ChatAdminRequiredError, PeerIdInvalidError, UserBannedInChannelError
+)
+
+# Live latency tracing: samples kept per stage for the percentiles
+LATENCY_WINDOW = max(1, int(os.environ.get('LATENCY_WINDOW', '1000')))
+
+# Bulk job progress: minimum seconds between edits of the status message
+PROGRESS_EDIT_INTERVAL = float(os.environ.get('PROGRESS_EDIT_INTERVAL', '5'))
+
 # Data storage
-CONFIG_FILE = 'config.json'
+CONFIG_DB = os.environ.get('CONFIG_DB', 'config.db')
+CONFIG_FILE = 'config.json'  # Legacy store, imported into CONFIG_DB on first run
+CONFIG_FLUSH_INTERVAL = float(os.environ.get('CONFIG_FLUSH_INTERVAL', '5'))
+DEDUP_BLOOM_BITS = int(os.environ.get('DEDUP_BLOOM_BITS', str(8 * 1024 * 1024)))  # 1 MB in-memory filter
+DEDUP_MEDIA = os.environ.get('DEDUP_MEDIA', '1') == '1'  # Also skip the same file sent from another message
+JOB_CHECKPOINT_EVERY = int(os.environ.get('JOB_CHECKPOINT_EVERY', '500'))  # messages between bulk job checkpoints
+MAX_ACTIVE_JOBS = int(os.environ.get('MAX_ACTIVE_JOBS', '4'))  # bulk jobs running at once, all users
+MAX_JOBS_PER_USER = int(os.environ.get('MAX_JOBS_PER_USER', '1'))  # bulk jobs running at once per user
 
-def load_config():
-    """Load configuration from file"""
-    try:
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r') as f:
-                return json.load(f)
-    except Exception as e:
-        logger.error(f"Error loading config: {e}")
-    return {}
+class Metrics:
+    """Counters and histograms rendered in the Prometheus text format.
+    
+    Recording is a dict update, cheap enough for hot paths. Gauges are read
+    from live state when /metrics is scraped instead of being maintained.
+    """
+    
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # Seconds
+    
+    def __init__(self):
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [count per bucket..., overflow, sum]
+    
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(labels.items()))
+        self.counters[key] = self.counters.get(key, 0) + value
+    
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(labels.items()))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = [0] * (len(self.BUCKETS) + 1) + [0.0]
+        histogram[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        histogram[-1] += seconds
+    
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+    
+    def render(self, gauges=()):
+        """Text exposition of all metrics; gauges are (name, labels, value) from the caller"""
+        lines = []
+        typed = set()
+        
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+        
+        for (name, labels), value in sorted(self.counters.items()):
+            declare(name, 'counter')
+            lines.append(f"{name}{self._labels(labels)} {value}")
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            declare(name, 'histogram')
+            total = 0
+            for bound, count in zip(self.BUCKETS + ('+Inf',), histogram):
+                total += count
+                lines.append(f"{name}_bucket{self._labels(labels + (('le', bound),))} {total}")
+            lines.append(f"{name}_sum{self._labels(labels)} {histogram[-1]}")
+            lines.append(f"{name}_count{self._labels(labels)} {total}")
+        for name, labels, value in gauges:
+            declare(name, 'gauge')
+            lines.append(f"{name}{self._labels(tuple(labels.items()))} {value}")
+        return "\n".join(lines) + "\n"
 
-def save_config(config):
-    """Save configuration to file"""
-    try:
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(config, f, indent=2)
-    except Exception as e:
-        logger.error(f"Error saving config: {e}")
+metrics = Metrics()
+
+class LatencyTracker:
+    """Sliding windows of live-forward stage timings, for percentiles.
+    
+    Stages: receive (post time to arrival, second precision since Telegram
+    dates are whole seconds), route, resolve, send, persist and total (post
+    time to confirmed send). Send times are also kept per target.
+    """
+    
+    STAGES = ('receive', 'route', 'resolve', 'send', 'persist', 'total')
+    QUANTILES = (0.5, 0.95, 0.99)
+    
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self.stages = {stage: deque(maxlen=window) for stage in self.STAGES}
+        self.targets = {}  # target chat -> deque of send times
+    
+    def record(self, stage, seconds, target=None):
+        self.stages[stage].append(seconds)
+        metrics.observe('forwarder_live_stage_seconds', seconds, stage=stage)
+        if target is not None:
+            samples = self.targets.get(target)
+            if samples is None:
+                samples = self.targets[target] = deque(maxlen=self.window)
+            samples.append(seconds)
+    
+    def percentiles(self, samples):
+        """(p50, p95, p99) of a window, or None if it is empty"""
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return tuple(ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in self.QUANTILES)
+    
+    def summary(self):
+        """Stage -> (p50, p95, p99) for stages with samples"""
+        result = {}
+        for stage, samples in self.stages.items():
+            values = self.percentiles(samples)
+            if values:
+                result[stage] = values
+        return result
+
+live_latency = LatencyTracker()
+
+class ConfigStore:
+    """Per-user settings store backed by SQLite in WAL mode.
+    
+    Each user is one row holding the session's JSON, so saving a user never
+    touches anyone else's data, and every write is an atomic transaction.
+    """
+    
+    def __init__(self, path, legacy_path=None):
+        self.path = path
+        self.legacy_path = legacy_path
+        self._db = None
+    
+    def _conn(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, data TEXT NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, kind TEXT NOT NULL, "
+                "params TEXT NOT NULL, last_id INTEGER NOT NULL DEFAULT 0, forwarded INTEGER NOT NULL DEFAULT 0, "
+                "failed INTEGER NOT NULL DEFAULT 0, status TEXT NOT NULL, updated REAL NOT NULL, "
+                "progress TEXT NOT NULL DEFAULT '{}')"
+            )
+            self._db.execute("CREATE TABLE IF NOT EXISTS forwarded (key TEXT PRIMARY KEY) WITHOUT ROWID")
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(jobs)")]
+            if 'progress' not in columns:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN progress TEXT NOT NULL DEFAULT '{}'")
+            self._db.commit()
+            self._import_legacy()
+        return self._db
+    
+    def _import_legacy(self):
+        """Move users from the old config.json into the database once"""
+        if not self.legacy_path or not os.path.exists(self.legacy_path):
+            return
+        if self._db.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+            return
+        try:
+            with open(self.legacy_path, 'r') as f:
+                legacy = json.load(f)
+            self.upsert_many((int(user_id), data) for user_id, data in legacy.items())
+            os.replace(self.legacy_path, self.legacy_path + '.migrated')
+            logger.info(f"Imported {len(legacy)} users from {self.legacy_path}")
+        except Exception as e:
+            logger.error(f"Error importing {self.legacy_path}: {e}")
+    
+    def load(self, user_id):
+        """Return the stored settings for one user, or {}"""
+        try:
+            row = self._conn().execute(
+                "SELECT data FROM users WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            return json.loads(row[0]) if row else {}
+        except Exception as e:
+            logger.error(f"Error loading config: {e}")
+            return {}
+    
+    def load_all(self):
+        """Return {user_id: settings} for every stored user in a single query"""
+        try:
+            rows = self._conn().execute("SELECT user_id, data FROM users").fetchall()
+            return {user_id: json.loads(data) for user_id, data in rows}
+        except Exception as e:
+            logger.error(f"Error loading config: {e}")
+            return {}
+    
+    def upsert(self, user_id, data):
+        """Insert or replace one user's settings"""
+        self.upsert_many([(user_id, data)])
+    
+    def upsert_many(self, rows):
+        """Insert or replace several users in a single transaction"""
+        try:
+            with self._conn() as db:
+                db.executemany(
+                    "INSERT INTO users (user_id, data) VALUES (?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+                    [(user_id, json.dumps(data)) for user_id, data in rows]
+                )
+        except Exception as e:
+            logger.error(f"Error saving config: {e}")
+    
+    def save_job(self, job):
+        """Insert a new bulk job or update its checkpoint and status"""
+        try:
+            with self._conn() as db:
+                if job.job_id is None:
+                    cursor = db.execute(
+                        "INSERT INTO jobs (user_id, kind, params, last_id, forwarded, failed, status, updated, progress) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (job.user_id, job.kind, json.dumps(job.params), job.last_id,
+                         job.forwarded, job.failed, job.status, time.time(), json.dumps(job.progress()))
+                    )
+                    job.job_id = cursor.lastrowid
+                else:
+                    db.execute(
+                        "UPDATE jobs SET last_id = ?, forwarded = ?, failed = ?, status = ?, updated = ?, progress = ? "
+                        "WHERE job_id = ?",
+                        (job.last_id, job.forwarded, job.failed, job.status, time.time(),
+                         json.dumps(job.progress()), job.job_id)
+                    )
+        except Exception as e:
+            logger.error(f"Error saving job: {e}")
+    
+    def load_jobs(self, *statuses):
+        """Return all bulk jobs with one of the given statuses, oldest first"""
+        try:
+            rows = self._conn().execute(
+                "SELECT job_id, user_id, kind, params, last_id, forwarded, failed, status, progress "
+                f"FROM jobs WHERE status IN ({', '.join('?' * len(statuses))}) ORDER BY job_id", statuses
+            ).fetchall()
+        except Exception as e:
+            logger.error(f"Error loading jobs: {e}")
+            return []
+        return [
+            BulkJob(user_id, kind, json.loads(params), job_id=job_id, last_id=last_id,
+                    forwarded=forwarded, failed=failed, status=job_status, progress=json.loads(progress))
+            for job_id, user_id, kind, params, last_id, forwarded, failed, job_status, progress in rows
+        ]
+    
+    def add_forwarded(self, keys):
+        """Record dedup keys of delivered messages"""
+        try:
+            with self._conn() as db:
+                db.executemany("INSERT OR IGNORE INTO forwarded (key) VALUES (?)", [(key,) for key in keys])
+        except Exception as e:
+            logger.error(f"Error saving dedup keys: {e}")
+    
+    def find_forwarded(self, keys):
+        """Return the subset of keys that are recorded"""
+        found = set()
+        keys = list(keys)
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self._conn().execute(
+                f"SELECT key FROM forwarded WHERE key IN ({', '.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            found.update(row[0] for row in rows)
+        return found
+    
+    def iter_forwarded(self):
+        """Yield every recorded dedup key"""
+        yield from (row[0] for row in self._conn().execute("SELECT key FROM forwarded"))
+    
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+config_store = ConfigStore(CONFIG_DB, legacy_path=CONFIG_FILE)
+
+def message_file(message):
+    """The photo or document a message carries, None for text (link preview images included)"""
+    media = getattr(message, 'media', None)
+    if isinstance(media, MessageMediaPhoto):
+        return media.photo
+    if isinstance(media, MessageMediaDocument):
+        return media.document
+    return None
+
+class DedupIndex:
+    """Which (source, message) pairs and media files each target already received.
+    
+    A fixed-size Bloom filter answers most lookups for new messages without
+    touching disk; only possible hits are confirmed against the forwarded
+    table. New keys are buffered and written with the periodic flush.
+    """
+    
+    HASHES = 7
+    
+    def __init__(self, bits=DEDUP_BLOOM_BITS):
+        self.bits = bits
+        self.bloom = bytearray((bits + 7) // 8)
+        self.pending = set()  # Keys not yet written to the store
+        self.loaded = False
+    
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.HASHES)]
+    
+    def _bloom_add(self, key):
+        for position in self._positions(key):
+            self.bloom[position >> 3] |= 1 << (position & 7)
+    
+    def _bloom_has(self, key):
+        return all(self.bloom[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+    
+    def load(self):
+        """Fill the Bloom filter from the store once at startup"""
+        count = 0
+        for key in config_store.iter_forwarded():
+            self._bloom_add(key)
+            count += 1
+        self.loaded = True
+        return count
+    
+    @staticmethod
+    def message_keys(target, source, message):
+        keys = [f"{target}|m:{source}:{message.id}"]
+        media = message_file(message)
+        if DEDUP_MEDIA and media is not None:
+            keys.append(f"{target}|f:{media.id}")
+        return keys
+    
+    def _seen(self, keys):
+        """Return the subset of keys already delivered"""
+        seen = {key for key in keys if key in self.pending}
+        candidates = [key for key in keys if key not in seen and self._bloom_has(key)]
+        if candidates:
+            seen |= config_store.find_forwarded(candidates)
+        return seen
+    
+    def filter_new(self, target, source, messages):
+        """Return the messages the target has not received yet, without repeats inside the list"""
+        keyed = [(message, self.message_keys(target, source, message)) for message in messages]
+        seen = self._seen([key for _, keys in keyed for key in keys])
+        fresh = []
+        for message, keys in keyed:
+            if any(key in seen for key in keys):
+                continue
+            seen.update(keys)
+            fresh.append(message)
+        return fresh
+    
+    def add(self, target, source, messages):
+        """Remember that the target received these messages"""
+        for message in messages:
+            for key in self.message_keys(target, source, message):
+                self._bloom_add(key)
+                self.pending.add(key)
+    
+    def flush(self):
+        if self.pending:
+            keys, self.pending = self.pending, set()
+            config_store.add_forwarded(keys)
+
+dedup_index = DedupIndex()
+
+class BulkJob:
+    """A persisted bulk forwarding job and its high-water mark.
+    
+    last_id is the highest source message ID already handled, so an
+    interrupted job can continue with iter_messages(min_id=last_id).
+    """
+    
+    def __init__(self, user_id, kind, params, job_id=None, last_id=0, forwarded=0, failed=0, status='running',
+                 progress=None):
+        progress = progress or {}
+        self.job_id = job_id
+        self.user_id = user_id
+        self.kind = kind  # all, range, files
+        self.params = params  # Includes 'targets', fixed when the job is created
+        self.last_id = last_id
+        self.forwarded = forwarded  # Deliveries summed over all targets
+        self.failed = failed
+        self.messages = progress.get('messages', 0)  # Source messages handled
+        self.skipped = progress.get('skipped', 0)  # Deliveries skipped as already forwarded
+        self.filtered = progress.get('filtered', 0)  # Source messages left out by the session's rules
+        self.target_stats = {int(chat): counts for chat, counts in progress.get('targets', {}).items()}
+        self.status = status  # queued, running, done, stopped, failed
+        self.cancel_requested = False  # Set when the user stops the job, as opposed to a shutdown
+        self.run_forwarded = 0  # Forwarded since this process picked the job up
+        self.copied_bytes = [0, 0]  # Copy mode: bytes downloaded, uploaded since this process picked the job up
+        self.copy_seconds = 0.0  # Copy mode: time spent copying
+        self.copy_reused = 0  # Copy mode: sends that reused an earlier upload instead of uploading
+        self.buffer_held = 0  # Copy mode: bytes of copy_budget this job holds, and the most it held
+        self.buffer_peak = 0
+        self.started = time.monotonic()
+        self._checkpointed = self.processed
+    
+    @property
+    def processed(self):
+        return self.messages
+    
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+    
+    def progress(self):
+        """Counters stored alongside the job row"""
+        return {
+            'messages': self.messages, 'skipped': self.skipped, 'filtered': self.filtered,
+            'targets': self.target_stats
+        }
+    
+    def record(self, target_id, forwarded_ids, failed_ids):
+        """Account for one batch delivered to one target"""
+        counts = self.target_stats.setdefault(target_id, [0, 0])
+        counts[0] += len(forwarded_ids)
+        counts[1] += len(failed_ids)
+        self.forwarded += len(forwarded_ids)
+        self.failed += len(failed_ids)
+        self.run_forwarded += len(forwarded_ids)
+        metrics.inc('forwarder_messages_forwarded_total', len(forwarded_ids), user=self.user_id, mode=self.kind)
+        metrics.inc('forwarder_messages_failed_total', len(failed_ids), user=self.user_id, mode=self.kind)
+    
+    def advance(self, batch_size, high_water):
+        """Move the high-water mark past a finished batch; checkpoint every JOB_CHECKPOINT_EVERY messages"""
+        self.messages += batch_size
+        self.last_id = max(self.last_id, high_water)
+        if self.processed - self._checkpointed >= JOB_CHECKPOINT_EVERY:
+            self.checkpoint()
+    
+    def checkpoint(self):
+        config_store.save_job(self)
+        self._checkpointed = self.processed
+    
+    def finish(self, status):
+        self.status = status
+        active_jobs.pop(self.job_id, None)
+        if self.job_id is not None:
+            config_store.save_job(self)
+
+# job_id -> BulkJob currently being forwarded by this process
+active_jobs = {}
+
+def new_job(user_id, kind, **params):
+    """Create a bulk job for the user's current target channels and rules"""
+    session = get_session(user_id)
+    params['targets'] = list(session.target_channels)
+    params['rules'] = session.rules
+    return BulkJob(user_id, kind, params)
+
+class JobManager:
+    """Runs bulk jobs as tracked asyncio tasks within per-user and global limits.
+    
+    Jobs over the limits wait in a FIFO queue and start as running jobs finish.
+    """
+    
+    def __init__(self, max_active=MAX_ACTIVE_JOBS, max_per_user=MAX_JOBS_PER_USER):
+        self.max_active = max_active
+        self.max_per_user = max_per_user
+        self.running = {}  # job_id -> (job, task)
+        self.queue = deque()
+        self.closing = False
+    
+    def _user_running(self, user_id):
+        return sum(1 for job, _ in self.running.values() if job.user_id == user_id)
+    
+    def _can_start(self, job):
+        return (len(self.running) < self.max_active
+                and self._user_running(job.user_id) < self.max_per_user)
+    
+    def submit(self, job):
+        """Start the job now if limits allow, otherwise queue it.
+        
+        Returns 0 if the job started, or its position in the queue.
+        """
+        job.status = 'queued'
+        job.checkpoint()  # Persisted so a queued job also survives a restart
+        if self._can_start(job):
+            self._start(job)
+            return 0
+        self.queue.append(job)
+        return len(self.queue)
+    
+    def _start(self, job):
+        job.status = 'running'
+        job.started = time.monotonic()
+        job.checkpoint()
+        task = asyncio.create_task(self._run(job))
+        self.running[job.job_id] = (job, task)
+    
+    async def _run(self, job):
+        try:
+            await run_bulk_job(job)
+        except asyncio.CancelledError:
+            if job.cancel_requested:
+                job.finish('stopped')
+                try:
+                    await bot.send_message(job.user_id, "⏸️ Forwarding stopped by user!")
+                except Exception:
+                    pass
+            raise
+        finally:
+            self.running.pop(job.job_id, None)
+            if not self.closing:
+                self._start_next()
+    
+    def _start_next(self):
+        for job in list(self.queue):
+            if len(self.running) >= self.max_active:
+                break
+            if self._can_start(job):
+                self.queue.remove(job)
+                self._start(job)
+    
+    def cancel_user(self, user_id):
+        """Cancel every running and queued job of a user; returns how many"""
+        cancelled = 0
+        for job in [job for job in self.queue if job.user_id == user_id]:
+            self.queue.remove(job)
+            job.finish('stopped')
+            cancelled += 1
+        for job, task in list(self.running.values()):
+            if job.user_id == user_id:
+                job.cancel_requested = True
+                task.cancel()
+                cancelled += 1
+        return cancelled
+    
+    def user_jobs(self, user_id):
+        """Return [(job, state)] for a user's running and queued jobs"""
+        jobs = [(job, 'running') for job, _ in self.running.values() if job.user_id == user_id]
+        for position, job in enumerate(self.queue, 1):
+            if job.user_id == user_id:
+                jobs.append((job, f"queued #{position}"))
+        return jobs
+    
+    def shutdown(self):
+        """Stop starting new jobs; running ones keep their status so they resume on next start"""
+        self.closing = True
+        for job, task in list(self.running.values()):
+            task.cancel()
+
+job_manager = JobManager()
 
 # Initialize bot client (will connect in main)
 bot = TelegramClient('bot', API_ID, API_HASH)
 
-# Initialize user client for fetching messages (created per user)
-user_clients = {}  # Store user clients per user_id
+class EntityCache:
+    """TTL + LRU cache of resolved InputPeers per (client, chat) and of each client's own identity"""
+    
+    def __init__(self, ttl=ENTITY_CACHE_TTL, max_size=ENTITY_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._peers = OrderedDict()  # (client, chat) -> (expires_at, input_peer)
+        self._me = {}  # client -> (expires_at, input_peer_user)
+        self.hits = 0
+        self.misses = 0
+    
+    async def get(self, client, chat):
+        """Return the InputPeer for chat as seen by client, resolving it only when needed"""
+        key = (client, chat)
+        entry = self._peers.get(key)
+        now = time.monotonic()
+        if entry and entry[0] > now:
+            self._peers.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        
+        self.misses += 1
+        peer = await client.get_input_entity(chat)
+        self._peers[key] = (now + self.ttl, peer)
+        self._peers.move_to_end(key)
+        while len(self._peers) > self.max_size:
+            self._peers.popitem(last=False)
+        return peer
+    
+    async def get_me(self, client):
+        """Return client's own InputPeerUser"""
+        entry = self._me.get(client)
+        now = time.monotonic()
+        if entry and entry[0] > now:
+            self.hits += 1
+            return entry[1]
+        
+        self.misses += 1
+        me = await client.get_me(input_peer=True)
+        self._me[client] = (now + self.ttl, me)
+        return me
+    
+    def invalidate(self, chat, client=None):
+        """Drop chat for one client, or for every client if none given"""
+        if client is not None:
+            self._peers.pop((client, chat), None)
+            return
+        for key in [key for key in self._peers if key[1] == chat]:
+            del self._peers[key]
+    
+    def forget_client(self, client):
+        """Drop everything cached for a client that is going away"""
+        for key in [key for key in self._peers if key[0] is client]:
+            del self._peers[key]
+        self._me.pop(client, None)
+
+entity_cache = EntityCache()
+
+class RateLimiter:
+    """Token bucket whose rate adapts AIMD-style to flood waits"""
+    
+    def __init__(self, rate=RATE_LIMIT_INITIAL, min_rate=RATE_LIMIT_MIN, max_rate=RATE_LIMIT_MAX,
+                 step=RATE_LIMIT_STEP):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.step = step
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.flood_waits = 0
+        self._lock = asyncio.Lock()
+    
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self):
+        """Wait until a request may be sent and take a token for it"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+    
+    def on_success(self):
+        """Additive increase"""
+        self.rate = min(self.max_rate, self.rate + self.step)
+        self.capacity = max(1.0, self.rate)
+    
+    def on_flood(self, seconds):
+        """Multiplicative decrease, and no requests until the wait is over"""
+        self.flood_waits += 1
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.capacity = max(1.0, self.rate)
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.blocked_until = max(self.blocked_until, self.updated + seconds)
+    
+    def stats(self):
+        """Current state for monitoring"""
+        now = time.monotonic()
+        self._refill(now)
+        return {
+            'rate': self.rate,
+            'tokens': self.tokens,
+            'blocked_for': max(0.0, self.blocked_until - now),
+            'flood_waits': self.flood_waits
+        }
+    
+    def delay(self):
+        """Seconds until acquire() would return"""
+        now = time.monotonic()
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(self.blocked_until - now, wait)
+
+# (client, chat_id) -> RateLimiter; chat_id None is the client-wide limiter
+rate_limiters = {}
+
+def get_rate_limiter(client, chat_id=None):
+    """Get or create the limiter for a client, or for one destination chat of it"""
+    key = (client, chat_id)
+    if key not in rate_limiters:
+        if chat_id is None:
+            rate_limiters[key] = RateLimiter(max_rate=RATE_LIMIT_CLIENT_MAX)
+        else:
+            rate_limiters[key] = RateLimiter()
+    return rate_limiters[key]
+
+class BotToken:
+    """A bot account that sends messages, with its delivery counters"""
+    
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.requests = 0
+        self.messages = 0
+        self.flood_waits = 0
+        self.failovers = 0  # Requests moved to another token after a flood wait here
+        self.unusable = {}  # chat_id -> time until which this bot is not tried there
+        self.started = time.monotonic()
+    
+    def usable(self, chat_id):
+        return self.unusable.get(chat_id, 0.0) <= time.monotonic()
+    
+    def delay(self, chat_id):
+        """Seconds until this bot may send to chat_id"""
+        return max(get_rate_limiter(self.client).delay(), get_rate_limiter(self.client, chat_id).delay())
+    
+    def rate(self):
+        """Messages per second since startup"""
+        return self.messages / max(1e-9, time.monotonic() - self.started)
+
+# Bots that deliver messages; the main bot first, extra tokens are added at startup
+sender_bots = [BotToken(bot, 'main')]
+
+async def resolve_chat_id(chat):
+    """Marked ID of chat, resolved through the first bot token that can see it"""
+    for index, token in enumerate(sender_bots):
+        try:
+            return utils.get_peer_id(await entity_cache.get(token.client, chat))
+        except (*ENTITY_ERRORS, ValueError):
+            if index == len(sender_bots) - 1:
+                raise
+
+async def send_via_bots(chat, call, count=1, on_flood=None):
+    """Run call(client, peer) on the bot that can send to chat soonest.
+    
+    Every bot token has its own limiters. When one hits a flood wait, the
+    request moves to another token; on_flood is only called when no token
+    can send right away. A bot lacking access to chat is skipped there for a
+    while; the error is raised once every token has failed.
+    """
+    chat_id = await resolve_chat_id(chat)
+    tried = set()
+    while True:
+        candidates = [token for token in sender_bots if token not in tried and token.usable(chat_id)]
+        if not candidates:
+            # Every untried bot is known not to work here; let them show the error
+            candidates = [token for token in sender_bots if token not in tried]
+        token = min(candidates, key=lambda token: token.delay(chat_id))
+        limiters = (get_rate_limiter(token.client), get_rate_limiter(token.client, chat_id))
+        for limiter in limiters:
+            await limiter.acquire()
+        peer = None
+        try:
+            peer = await entity_cache.get(token.client, chat)
+            result = await call(token.client, peer)
+        except FloodWaitError as e:
+            logger.warning(f"Flood wait on {token.name}: {e.seconds} seconds")
+            token.flood_waits += 1
+            metrics.inc('forwarder_flood_waits_total', bot=token.name)
+            metrics.inc('forwarder_flood_wait_seconds_total', e.seconds, bot=token.name)
+            for limiter in limiters:
+                limiter.on_flood(e.seconds)
+            wait = min(other.delay(chat_id) for other in candidates)
+            if wait > 0:
+                if on_flood:
+                    await on_flood(round(wait))
+            else:
+                token.failovers += 1
+            continue
+        except (*ENTITY_ERRORS, ValueError) as e:
+            if isinstance(e, ValueError) and peer is not None:
+                raise  # From call itself, not from resolving chat
+            entity_cache.invalidate(chat, token.client)
+            token.unusable[chat_id] = time.monotonic() + ENTITY_CACHE_TTL
+            tried.add(token)
+            if len(tried) == len(sender_bots):
+                raise
+            logger.warning(f"{token.name} cannot send to {chat_id}, using other tokens: {e}")
+            continue
+        for limiter in limiters:
+            limiter.on_success()
+        token.requests += 1
+        token.messages += count
+        metrics.inc('forwarder_bot_messages_total', count, bot=token.name)
+        return result
+
+def format_bot_tokens():
+    """Per-token delivery rates and the combined rate"""
+    lines = [
+        f"• {token.name}: {token.messages} msgs, {token.rate():.2f} msg/s, "
+        f"{token.flood_waits} flood waits, {token.failovers} failovers"
+        for token in sender_bots
+    ]
+    total = sum(token.rate() for token in sender_bots)
+    busiest = max(token.rate() for token in sender_bots)
+    gain = f" ({total / busiest:.1f}x one token)" if busiest > 0 and len(sender_bots) > 1 else ""
+    lines.append(f"• Combined: {total:.2f} msg/s{gain}")
+    return "\n".join(lines)
+
+async def start_sender_bots():
+    """Log in the extra bot tokens and add them to sender_bots"""
+    for index, token in enumerate(EXTRA_BOT_TOKENS, 1):
+        client = TelegramClient(f'bot{index}', API_ID, API_HASH)
+        try:
+            await client.start(bot_token=token)
+        except Exception as e:
+            logger.error(f"Error starting extra bot {index}: {e}")
+            continue
+        sender_bots.append(BotToken(client, f"bot{index}"))
+    logger.info(f"Sending with {len(sender_bots)} bot token(s)")
+
+class ClientPool:
+    """Per-user fetch clients, kept connected only while they are in use.
+    
+    Clients idle for longer than idle_timeout, or beyond max_size (least
+    recently used first), are disconnected and dropped; the next request for
+    that user builds a fresh client from the saved session string. Clients of
+    users with a running bulk job or a pending login code are never evicted.
+    Failed connects are retried no sooner than an exponentially growing delay.
+    """
+    
+    def __init__(self, max_size=CLIENT_POOL_SIZE, idle_timeout=CLIENT_IDLE_TIMEOUT,
+                 backoff=CLIENT_RECONNECT_BACKOFF, backoff_max=CLIENT_RECONNECT_BACKOFF_MAX):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._clients = OrderedDict()  # user_id -> (client, last_used)
+        self._retry = {}  # user_id -> (retry_at, delay) after a failed connect
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.connects = 0
+        self.connect_errors = 0
+        self.connect_time = 0.0  # Total seconds spent in successful connects
+    
+    def __contains__(self, user_id):
+        return user_id in self._clients
+    
+    def __len__(self):
+        return len(self._clients)
+    
+    def peek(self, user_id):
+        """Return the pooled client without creating or connecting one"""
+        entry = self._clients.get(user_id)
+        if entry is None:
+            return None
+        self._touch(user_id, entry[0])
+        return entry[0]
+    
+    def _touch(self, user_id, client):
+        self._clients[user_id] = (client, time.monotonic())
+        self._clients.move_to_end(user_id)
+    
+    async def get(self, user_id, session_string=''):
+        """Return a connected client for user_id, creating it if needed"""
+        entry = self._clients.get(user_id)
+        if entry is not None:
+            self.hits += 1
+            client = entry[0]
+        else:
+            self.misses += 1
+            client = TelegramClient(StringSession(session_string or ''), API_ID, API_HASH)
+        
+        if not client.is_connected():
+            await self._connect(user_id, client)
+        self._touch(user_id, client)
+        await self._trim()
+        return client
+    
+    async def _connect(self, user_id, client):
+        retry_at, delay = self._retry.get(user_id, (0.0, 0.0))
+        wait = retry_at - time.monotonic()
+        if wait > 0:
+            raise ConnectionError(f"Connection to Telegram failed recently, retrying in {wait:.0f}s")
+        
+        started = time.monotonic()
+        try:
+            await client.connect()
+        except Exception as e:
+            self.connect_errors += 1
+            delay = min(self.backoff_max, delay * 2 if delay else self.backoff)
+            self._retry[user_id] = (time.monotonic() + delay, delay)
+            logger.error(f"Error connecting client for {user_id}, next attempt in {delay:.0f}s: {e}")
+            raise
+        self.connects += 1
+        self.connect_time += time.monotonic() - started
+        self._retry.pop(user_id, None)
+    
+    async def put(self, user_id, client):
+        """Adopt an already connected client, replacing any pooled one"""
+        entry = self._clients.get(user_id)
+        if entry is not None and entry[0] is not client:
+            await self._close(entry[0])
+        self._touch(user_id, client)
+        await self._trim()
+    
+    def _busy(self, user_id):
+        session = user_sessions.get(user_id)
+        if session is not None and session.mode == 'awaiting_auth_code':
+            return True
+        return any(job.user_id == user_id for job, _ in job_manager.running.values())
+    
+    async def evict(self, user_id):
+        """Disconnect and drop one user's client"""
+        entry = self._clients.pop(user_id, None)
+        if entry is None:
+            return
+        self.evictions += 1
+        await self._close(entry[0])
+    
+    async def _close(self, client):
+        entity_cache.forget_client(client)
+        for key in [key for key in rate_limiters if key[0] is client]:
+            del rate_limiters[key]
+        try:
+            await client.disconnect()
+        except Exception as e:
+            logger.error(f"Error disconnecting client: {e}")
+    
+    async def _trim(self):
+        """Evict least recently used idle clients above max_size"""
+        excess = len(self._clients) - self.max_size
+        for user_id in list(self._clients):
+            if excess <= 0:
+                break
+            if not self._busy(user_id):
+                await self.evict(user_id)
+                excess -= 1
+    
+    async def evict_idle(self):
+        """Evict clients unused for longer than idle_timeout"""
+        cutoff = time.monotonic() - self.idle_timeout
+        idle = [
+            user_id for user_id, (_, last_used) in self._clients.items()
+            if last_used < cutoff and not self._busy(user_id)
+        ]
+        for user_id in idle:
+            await self.evict(user_id)
+        return len(idle)
+    
+    async def close_all(self):
+        for user_id in list(self._clients):
+            await self.evict(user_id)
+    
+    def stats(self):
+        return {
+            'size': len(self._clients),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'connect_errors': self.connect_errors,
+            'connect_ms': self.connect_time / self.connects * 1000 if self.connects else 0.0
+        }
+
+# Fetch clients per user_id
+client_pool = ClientPool()
+
+async def client_reaper():
+    """Periodically disconnect idle fetch clients"""
+    while True:
+        await asyncio.sleep(min(60.0, client_pool.idle_timeout))
+        try:
+            evicted = await client_pool.evict_idle()
+            if evicted:
+                logger.info(f"Disconnected {evicted} idle client(s)")
+        except Exception as e:
+            logger.error(f"Error evicting idle clients: {e}")
+
+# Patterns start with a literal so re can skip ahead instead of trying every position
+LINK_RE = re.compile(r'(?:https?://|www\.|t(?:elegram)?\.me/)\S+')  # Searched in lowercased text
+USERNAME_RE = re.compile(r'@(?<![\w@]@)[A-Za-z][A-Za-z0-9_]{3,31}\b')
+SPACES_RE = re.compile(r'[ \t]{2,}')
+SIZE_UNITS = {'G': 2 ** 30, 'M': 2 ** 20, 'K': 2 ** 10, '': 1}  # Largest first, for format_rules
+SIZE_RE = re.compile(r'^(\d+(?:\.\d+)?)\s*([KMG]?B?)$', re.IGNORECASE)
+RULE_KINDS = set(MEDIA_FILTERS) | {'text'}
+
+def message_kind(message):
+    """MEDIA_FILTERS key of a message's media, 'document' for other files, or 'text' (link previews included)"""
+    media = getattr(message, 'media', None)
+    if media is None or isinstance(media, MessageMediaWebPage):
+        return 'text'
+    if isinstance(media, MessageMediaPhoto):
+        return 'photo'
+    if isinstance(media, MessageMediaDocument):
+        for key, attribute in (('round', 'video_note'), ('gif', 'gif'), ('voice', 'voice'),
+                               ('audio', 'audio'), ('video', 'video')):
+            if getattr(message, attribute, None):
+                return key
+    return 'document'
+
+def parse_size(text):
+    """Parse sizes like 500KB, 20MB or 1.5GB into bytes"""
+    match = SIZE_RE.match(text.strip())
+    if not match:
+        raise ValueError(f"Invalid size: {text}")
+    unit = match.group(2).upper().rstrip('B')
+    return int(float(match.group(1)) * SIZE_UNITS[unit])
+
+def literal_pattern(words):
+    """Regex matching any of words, built as a prefix trie.
+    
+    Python's re tries every branch of a flat `a|b|c` alternation at each
+    position; sharing prefixes keeps the cost nearly flat as words are added.
+    Longer words win over their prefixes, like a longest-first alternation.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and '' not in node:
+            return branches[0]
+        return "(?:" + "|".join(branches) + ")" + ("?" if '' in node else "")
+    
+    return build(trie)
+
+def parse_rules(text):
+    """Parse `key: value` lines of the /rules command into a rules dict"""
+    rules = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        key, sep, value = line.partition(':')
+        key, value = key.strip().lower(), value.strip()
+        if not sep or not value:
+            raise ValueError(f"Expected `key: value`, got: {line}")
+        items = [item.strip() for item in value.split(',') if item.strip()]
+        if key in ('include', 'exclude'):
+            rules[key] = rules.get(key, []) + items
+        elif key in ('regex', 'exclude_regex'):
+            rules[key] = rules.get(key, []) + [value]
+        elif key == 'media':
+            unknown = set(items) - RULE_KINDS
+            if unknown:
+                raise ValueError(f"Unknown media type(s): {', '.join(sorted(unknown))}")
+            rules['media'] = items
+        elif key in ('min_size', 'max_size'):
+            rules[key] = parse_size(value)
+        elif key == 'links':
+            if value not in ('any', 'require', 'block'):
+                raise ValueError("links must be any, require or block")
+            rules['links'] = value
+        elif key == 'strip':
+            unknown = set(items) - {'usernames', 'links'}
+            if unknown:
+                raise ValueError(f"strip takes usernames and/or links, not {', '.join(sorted(unknown))}")
+            rules['strip'] = items
+        elif key == 'replace':
+            old, arrow, new = value.partition('=>')
+            if not arrow or not old.strip():
+                raise ValueError("replace takes `old => new`")
+            rules['replace'] = rules.get('replace', []) + [[old.strip(), new.strip()]]
+        else:
+            raise ValueError(f"Unknown rule: {key}")
+    CompiledRules(rules)  # Reject invalid regexes now rather than when forwarding
+    return rules
+
+def format_rules(rules):
+    """Rules dict back in /rules syntax"""
+    lines = []
+    for key in ('include', 'exclude', 'media', 'strip'):
+        if rules.get(key):
+            lines.append(f"{key}: {', '.join(rules[key])}")
+    for key in ('regex', 'exclude_regex'):
+        lines.extend(f"{key}: {pattern}" for pattern in rules.get(key, []))
+    for key in ('min_size', 'max_size'):
+        if rules.get(key):
+            size = rules[key]
+            unit = next(unit for unit, factor in SIZE_UNITS.items() if size % factor == 0)
+            lines.append(f"{key}: {size // SIZE_UNITS[unit]}{unit}B")
+    if rules.get('links'):
+        lines.append(f"links: {rules['links']}")
+    lines.extend(f"replace: {old} => {new}" for old, new in rules.get('replace', []))
+    return "\n".join(lines)
+
+class CompiledRules:
+    """A session's filter and caption rules, compiled once.
+    
+    Keywords and regexes of each side are merged into a single pattern,
+    allowed media types become a set, and all caption replacements run as
+    one pattern, so checking a message costs a few regex scans whatever
+    the number of rules.
+    """
+    
+    def __init__(self, rules):
+        self.kinds = set(rules.get('media') or ()) or None
+        self.min_size = rules.get('min_size') or 0
+        self.max_size = rules.get('max_size') or None
+        self.links = rules.get('links', 'any')
+        self.include = self._combine(rules.get('include'), rules.get('regex'))
+        self.exclude = self._combine(rules.get('exclude'), rules.get('exclude_regex'))
+        
+        strip = set(rules.get('strip') or ())
+        patterns = [f"(?i:{LINK_RE.pattern})"] if 'links' in strip else []
+        if 'usernames' in strip:
+            patterns.append(USERNAME_RE.pattern)
+        self.strip = re.compile("|".join(patterns)) if patterns else None
+        self.replacements = dict(rules.get('replace') or ())
+        self.replace = re.compile(literal_pattern(self.replacements)) if self.replacements else None
+        self.rewrites = self.strip is not None or self.replace is not None
+    
+    @staticmethod
+    def _combine(keywords, regexes):
+        parts = []
+        if keywords:
+            parts.append(f"(?i:{literal_pattern(keywords)})")
+        parts.extend(f"(?:{pattern})" for pattern in regexes or ())
+        return re.compile("|".join(parts)) if parts else None
+    
+    def matches(self, message):
+        """Whether a message passes the filters"""
+        if self.kinds is not None and message_kind(message) not in self.kinds:
+            return False
+        if self.min_size or self.max_size:
+            file = message.file if message_file(message) is not None else None
+            size = file.size if file and file.size else 0
+            if size < self.min_size or (self.max_size and size > self.max_size):
+                return False
+        text = message.message or ""
+        if self.exclude is not None and self.exclude.search(text):
+            return False
+        if self.include is not None and not self.include.search(text):
+            return False
+        if self.links != 'any':
+            has_link = bool(LINK_RE.search(text.lower())) or any(
+                isinstance(entity, (MessageEntityUrl, MessageEntityTextUrl)) for entity in message.entities or ()
+            )
+            if has_link != (self.links == 'require'):
+                return False
+        return True
+    
+    def _replace(self, match):
+        return self.replacements[match.group(0)]
+    
+    def transform(self, text):
+        """Caption with the strip and replace rules applied"""
+        if not text:
+            return text
+        if self.strip is not None:
+            text = SPACES_RE.sub(' ', self.strip.sub("", text)).strip()
+        if self.replace is not None:
+            text = self.replace.sub(self._replace, text)
+        return text
+    
+    def caption(self, message):
+        """(text, entities) to send for a message; entities are dropped when the text changed"""
+        text = message.message or ""
+        rewritten = self.transform(text)
+        return rewritten, (message.entities if rewritten == text else None)
 
 # User sessions storage
 user_sessions = {}
 
+# Live routing index: source chat ID -> {user_id: session}
+live_routes = {}
+
 class UserSession:
+    # No per-instance __dict__: a loaded session takes about 15% less memory
+    __slots__ = (
+        'user_id', 'source_channel', 'target_channels', 'mode', 'forward_count', 'target_stats',
+        'user_phone', 'session_string', 'routed_source', 'pending_media_type', 'pending_job',
+        'rules', 'compiled_rules', 'last_used'
+    )
+    
     def __init__(self, user_id):
         self.user_id = user_id
         self.source_channel = None
-        self.target_channel = None
+        self.target_channels = []
         self.mode = 'idle'  # idle, live, selective, awaiting_phone, awaiting_auth_code
         self.forward_count = 0
+        self.target_stats = {}  # Live mode: target chat -> [forwarded, failed]
         self.user_phone = None
         self.session_string = None  # Store session string
-        self.stop_forwarding = False  # Flag to stop ongoing forwarding
+        self.routed_source = None  # Source chat this session is indexed under in live_routes
+        self.pending_media_type = 'all'  # Media type picked for the next Till File job
+        self.pending_job = None  # (kind, params) shown in a plan and waiting for confirmation
+        self.rules = None  # Filter and caption rules, see parse_rules; None instead of an empty dict per session
+        self.compiled_rules = None  # CompiledRules for self.rules, None when there are none
+        self.last_used = time.monotonic()  # For evicting idle sessions from user_sessions
+    
+    def set_mode(self, mode):
+        """Change mode and keep live_routes in sync with it"""
+        self.mode = mode
+        update_live_route(self)
+    
+    def set_rules(self, rules):
+        self.rules = rules or None
+        self.compiled_rules = CompiledRules(rules) if rules else None
         
     def to_dict(self):
         return {
             'source_channel': self.source_channel,
-            'target_channel': self.target_channel,
+            'target_channels': self.target_channels,
             'mode': self.mode,
             'forward_count': self.forward_count,
+            'target_stats': self.target_stats,
             'user_phone': self.user_phone,
-            'session_string': self.session_string
+            'session_string': self.session_string,
+            'rules': self.rules
+        }
+
+def session_from_config(user_id, user_config):
+    """Build a UserSession from its stored settings"""
+    session = UserSession(user_id)
+    if user_config:
+        session.source_channel = user_config.get('source_channel')
+        session.target_channels = user_config.get('target_channels') or (
+            [user_config['target_channel']] if user_config.get('target_channel') else []
+        )
+        session.mode = user_config.get('mode', 'idle')
+        session.forward_count = user_config.get('forward_count', 0)
+        session.target_stats = {
+            int(chat): counts for chat, counts in user_config.get('target_stats', {}).items()
         }
+        session.user_phone = user_config.get('user_phone')
+        session.session_string = user_config.get('session_string')
+        try:
+            session.set_rules(user_config.get('rules') or {})
+        except re.error as e:
+            logger.error(f"Ignoring invalid rules of user {user_id}: {e}")
+    return session
 
 def get_session(user_id):
-    """Get or create user session"""
-    if user_id not in user_sessions:
-        config = load_config()
-        user_config = config.get(str(user_id), {})
-        session = UserSession(user_id)
-        if user_config:
-            session.source_channel = user_config.get('source_channel')
-            session.target_channel = user_config.get('target_channel')
-            session.mode = user_config.get('mode', 'idle')
-            session.user_phone = user_config.get('user_phone')
-            session.session_string = user_config.get('session_string')
+    """Get or create user session, loading it from the store if it is not in memory"""
+    session = user_sessions.get(user_id)
+    if session is None:
+        session = session_from_config(user_id, config_store.load(user_id))
+        user_sessions[user_id] = session
+        update_live_route(session)
+    else:
+        session.last_used = time.monotonic()
+    return session
+
+def hydrate_sessions():
+    """Load the stored sessions that are not idle and build live_routes before updates arrive.
+    
+    Idle sessions are loaded on demand by get_session.
+    """
+    started = time.monotonic()
+    for user_id, user_config in config_store.load_all().items():
+        if user_id in user_sessions or user_config.get('mode', 'idle') == 'idle':
+            continue
+        session = session_from_config(user_id, user_config)
         user_sessions[user_id] = session
-    return user_sessions[user_id]
+        update_live_route(session)
+    
+    live_count = sum(len(subscribers) for subscribers in live_routes.values())
+    logger.info(
+        f"Hydrated {len(user_sessions)} sessions in {(time.monotonic() - started) * 1000:.0f} ms "
+        f"({live_count} live routes across {len(live_routes)} source chats)"
+    )
+
+def update_live_route(session):
+    """Keep live_routes in sync with the session's source channel and mode.
+    
+    Only the loaded session of a user is routed, never an evicted copy.
+    """
+    live = session.mode == 'live' and user_sessions.get(session.user_id) is session
+    new_source = session.source_channel if live and session.source_channel else None
+    old_source = session.routed_source
+    if new_source == old_source:
+        return
+    
+    if old_source is not None:
+        subscribers = live_routes.get(old_source)
+        if subscribers:
+            subscribers.pop(session.user_id, None)
+            if not subscribers:
+                del live_routes[old_source]
+    
+    if new_source is not None:
+        live_routes.setdefault(new_source, {})[session.user_id] = session
+    session.routed_source = new_source
+
+# Users whose in-memory session has changes (e.g. forward_count) not yet written
+dirty_sessions = set()
 
 def save_session(user_id):
     """Save user session to config"""
     if user_id in user_sessions:
-        config = load_config()
-        config[str(user_id)] = user_sessions[user_id].to_dict()
-        save_config(config)
+        config_store.upsert(user_id, user_sessions[user_id].to_dict())
+        dirty_sessions.discard(user_id)
+
+def mark_session_dirty(user_id):
+    """Schedule a session for the next periodic flush instead of writing it now"""
+    dirty_sessions.add(user_id)
+
+def flush_sessions():
+    """Write all dirty sessions in one transaction"""
+    if not dirty_sessions:
+        return
+    started = time.monotonic()
+    rows = [(user_id, user_sessions[user_id].to_dict()) for user_id in dirty_sessions if user_id in user_sessions]
+    dirty_sessions.clear()
+    config_store.upsert_many(rows)
+    metrics.observe('forwarder_config_flush_seconds', time.monotonic() - started)
+
+def session_pinned(session):
+    """Whether a session must stay in memory: live, waiting for input or owning a job"""
+    if session.mode != 'idle' or session.pending_job is not None:
+        return True
+    user_id = session.user_id
+    return (
+        user_id in dirty_sessions
+        or any(job.user_id == user_id for job, _ in job_manager.running.values())
+        or any(job.user_id == user_id for job in job_manager.queue)
+    )
+
+def evict_sessions(idle_timeout=SESSION_IDLE_TIMEOUT, max_size=SESSION_CACHE_SIZE):
+    """Drop idle sessions from memory; returns how many were evicted.
+    
+    Sessions unused for idle_timeout go first, then the least recently used
+    until at most max_size are loaded. Pinned sessions are never evicted.
+    Dirty sessions are flushed first so nothing unsaved is dropped.
+    """
+    flush_sessions()
+    now = time.monotonic()
+    candidates = sorted(
+        (session for session in user_sessions.values() if not session_pinned(session)),
+        key=lambda session: session.last_used
+    )
+    excess = len(user_sessions) - max_size
+    evicted = 0
+    for session in candidates:
+        if now - session.last_used < idle_timeout and evicted >= excess:
+            break
+        del user_sessions[session.user_id]
+        update_live_route(session)  # Drops any route left to the evicted object
+        evicted += 1
+    if evicted:
+        metrics.inc('forwarder_sessions_evicted_total', evicted)
+    return evicted
+
+async def session_reaper():
+    """Periodically evict idle sessions from memory"""
+    while True:
+        await asyncio.sleep(min(60.0, SESSION_IDLE_TIMEOUT))
+        try:
+            evicted = evict_sessions()
+            if evicted:
+                logger.info(f"Evicted {evicted} idle session(s), {len(user_sessions)} loaded")
+        except Exception as e:
+            logger.error(f"Error evicting idle sessions: {e}")
+
+async def session_flusher():
+    """Periodically persist coalesced session updates"""
+    while True:
+        await asyncio.sleep(CONFIG_FLUSH_INTERVAL)
+        flush_sessions()
+        dedup_index.flush()
 
 def is_admin(user_id):
     """Check if user is admin"""
@@ -115,20 +1479,8 @@ async def get_client_for_fetching(user_id):
         )
         return None
     
-    # Create or get user client with StringSession
-    if user_id not in user_clients:
-        session_str = session.session_string if session.session_string else ''
-        user_clients[user_id] = TelegramClient(
-            StringSession(session_str), 
-            API_ID, 
-            API_HASH
-        )
-    
-    client = user_clients[user_id]
-    
-    # Connect and authorize if needed
-    if not client.is_connected():
-        await client.connect()
+    # Get a connected client from the pool, created from the saved session if needed
+    client = await client_pool.get(user_id, session.session_string)
     
     if not await client.is_user_authorized():
         await client.send_code_request(session.user_phone)
@@ -138,23 +1490,28 @@ async def get_client_for_fetching(user_id):
             f"A code has been sent to: `{session.user_phone}`\n\n"
             "Please send the code here (format: `12345`)"
         )
-        session.mode = 'awaiting_auth_code'
+        session.set_mode('awaiting_auth_code')
         save_session(user_id)
         return None
     
     return client
 
 async def check_bot_permissions(channel_id, permission_type="source"):
-    """Check if bot is admin in the channel"""
+    """Check if every sending bot is admin in the channel"""
     try:
-        channel = await bot.get_entity(channel_id)
-        me = await bot.get_me()
-        participant = await bot.get_permissions(channel, me)
-        
-        if not participant.is_admin:
-            return False, f"❌ Bot is not admin in {permission_type} channel!\n\n⚠️ Please make the bot an admin in the channel."
+        for token in sender_bots:
+            channel = await entity_cache.get(token.client, channel_id)
+            me = await entity_cache.get_me(token.client)
+            participant = await token.client.get_permissions(channel, me)
+            
+            if not participant.is_admin:
+                name = "Bot" if token.client is bot else f"Extra bot `{token.name}`"
+                return False, f"❌ {name} is not admin in {permission_type} channel!\n\n⚠️ Please make the bot an admin in the channel."
         
         return True, "✅ Bot has admin permissions"
+    except ENTITY_ERRORS as e:
+        entity_cache.invalidate(channel_id)
+        return False, f"❌ Error checking permissions: {str(e)}"
     except Exception as e:
         return False, f"❌ Error checking permissions: {str(e)}"
 
@@ -173,13 +1530,14 @@ async def fix_handler(event):
         session.source_channel = int(f"-100{old}")
         fixed.append(f"Source: {old} → {session.source_channel}")
     
-    # Fix target if positive
-    if session.target_channel and session.target_channel > 0:
-        old = session.target_channel
-        session.target_channel = int(f"-100{old}")
-        fixed.append(f"Target: {old} → {session.target_channel}")
+    # Fix targets if positive
+    for index, old in enumerate(session.target_channels):
+        if old > 0:
+            session.target_channels[index] = int(f"-100{old}")
+            fixed.append(f"Target: {old} → {session.target_channels[index]}")
     
     if fixed:
+        update_live_route(session)
         save_session(event.sender_id)
         await event.respond(
             "✅ **Fixed channel IDs:**\n\n" + "\n".join(fixed) + 
@@ -188,6 +1546,52 @@ async def fix_handler(event):
     else:
         await event.respond("✅ Channel IDs are already correct!")
 
+RULES_HELP = (
+    "Send `/rules` followed by one rule per line:\n"
+    "`include: word, other` - only messages containing a keyword\n"
+    "`exclude: word, other` - skip messages containing a keyword\n"
+    "`regex: pattern` / `exclude_regex: pattern`\n"
+    "`media: photo, video, text` - only these types\n"
+    "`min_size: 1MB` / `max_size: 50MB`\n"
+    "`links: require` or `links: block`\n"
+    "`strip: usernames, links` - remove from captions\n"
+    "`replace: old => new` - rewrite captions\n\n"
+    "`/rules clear` removes all rules."
+)
+
+@bot.on(events.NewMessage(pattern=r'/rules(?:\s|$)'))
+async def rules_handler(event):
+    """Show, set or clear the filter and caption rules"""
+    if not is_admin(event.sender_id):
+        return
+    
+    session = get_session(event.sender_id)
+    body = event.message.message[len('/rules'):].strip()
+    
+    if not body:
+        current = format_rules(session.rules) if session.rules else "No rules set, everything is forwarded."
+        await event.respond(f"**🧹 Rules**\n\n```\n{current}\n```\n\n{RULES_HELP}")
+        return
+    
+    if body.lower() == 'clear':
+        session.set_rules({})
+        save_session(event.sender_id)
+        await event.respond("✅ Rules cleared, everything is forwarded.")
+        return
+    
+    try:
+        rules = parse_rules(body)
+    except (ValueError, re.error) as e:
+        await event.respond(f"❌ Invalid rules: {e}\n\n{RULES_HELP}")
+        return
+    
+    session.set_rules(rules)
+    save_session(event.sender_id)
+    await event.respond(
+        f"✅ **Rules saved!**\n\n```\n{format_rules(rules)}\n```\n\n"
+        "They apply to live forwarding and to bulk jobs started from now on."
+    )
+
 @bot.on(events.NewMessage(pattern='/start'))
 async def start_handler(event):
     """Handle /start command"""
@@ -200,6 +1604,7 @@ async def start_handler(event):
     buttons = [
         [Button.inline("📤 Set Source Channel", b"set_source")],
         [Button.inline("📥 Set Target Channel", b"set_target")],
+        [Button.inline("➕ Add Target Channel", b"add_target")],
         [Button.inline("📱 Set Phone Number", b"set_phone")],
         [Button.inline("⚙️ Forwarding Modes", b"modes")],
         [Button.inline("📊 Status", b"status")],
@@ -214,8 +1619,8 @@ async def start_handler(event):
     else:
         config_display += f"❌ Source: Not set\n"
     
-    if session.target_channel:
-        config_display += f"✅ Target: `{session.target_channel}`\n"
+    if session.target_channels:
+        config_display += f"✅ Targets: {format_targets(session.target_channels)}\n"
     else:
         config_display += f"❌ Target: Not set\n"
     
@@ -238,6 +1643,7 @@ async def main_menu(event):
     buttons = [
         [Button.inline("📤 Set Source Channel", b"set_source")],
         [Button.inline("📥 Set Target Channel", b"set_target")],
+        [Button.inline("➕ Add Target Channel", b"add_target")],
         [Button.inline("📱 Set Phone Number", b"set_phone")],
         [Button.inline("⚙️ Forwarding Modes", b"modes")],
         [Button.inline("📊 Status", b"status")],
@@ -266,22 +1672,36 @@ async def set_source(event):
         "Or forward a message from the channel."
     )
     session = get_session(event.sender_id)
-    session.mode = 'awaiting_source'
+    session.set_mode('awaiting_source')
 
 @bot.on(events.CallbackQuery(pattern=b"set_target"))
 async def set_target(event):
-    """Prompt user to set target channel"""
+    """Prompt user to set target channels"""
     await event.answer()
     await event.respond(
-        "📥 **Set Target Channel**\n\n"
+        "📥 **Set Target Channels**\n\n"
         "Please send me the target channel username or ID.\n"
+        f"Send several separated by spaces to mirror into up to {MAX_TARGETS} channels.\n"
         "Examples:\n"
         "• @channelname\n"
-        "• -1001234567890\n\n"
+        "• -1001234567890 -1009876543210\n\n"
+        "Or forward a message from the channel.\n"
+        "This replaces your current targets."
+    )
+    session = get_session(event.sender_id)
+    session.set_mode('awaiting_target')
+
+@bot.on(events.CallbackQuery(pattern=b"add_target"))
+async def add_target(event):
+    """Prompt user to add a target channel"""
+    await event.answer()
+    await event.respond(
+        "➕ **Add Target Channel**\n\n"
+        "Please send me the channel username or ID to add.\n"
         "Or forward a message from the channel."
     )
     session = get_session(event.sender_id)
-    session.mode = 'awaiting_target'
+    session.set_mode('awaiting_add_target')
 
 @bot.on(events.CallbackQuery(pattern=b"set_phone"))
 async def set_phone(event):
@@ -305,7 +1725,7 @@ async def set_phone(event):
         "Click button below to import session string",
         buttons=buttons
     )
-    session.mode = 'awaiting_phone'
+    session.set_mode('awaiting_phone')
 
 @bot.on(events.CallbackQuery(pattern=b"import_session"))
 async def import_session(event):
@@ -318,14 +1738,14 @@ async def import_session(event):
         "Format: Long alphanumeric string"
     )
     session = get_session(event.sender_id)
-    session.mode = 'awaiting_session_string'
+    session.set_mode('awaiting_session_string')
 
 @bot.on(events.CallbackQuery(pattern=b"modes"))
 async def show_modes(event):
     """Show forwarding modes"""
     session = get_session(event.sender_id)
     
-    if not session.source_channel or not session.target_channel:
+    if not session.source_channel or not session.target_channels:
         await event.answer("⚠️ Please set source and target channels first!", alert=True)
         return
     
@@ -335,6 +1755,7 @@ async def show_modes(event):
         [Button.inline("📝 Forward Range", b"mode_range")],
         [Button.inline("🔢 Forward Till Message", b"mode_till_msg")],
         [Button.inline("📁 Forward Till File", b"mode_till_file")],
+        [Button.inline("🎞 Forward By Media Type", b"mode_media_type")],
         [Button.inline("⏸️ Stop Forwarding", b"mode_stop")],
         [Button.inline("🔙 Back", b"main_menu")]
     ]
@@ -345,7 +1766,7 @@ async def show_modes(event):
         f"**⚙️ Forwarding Modes**\n\n"
         f"📋 **Saved Configuration:**\n"
         f"📤 Source: `{session.source_channel}`\n"
-        f"📥 Target: `{session.target_channel}`\n"
+        f"📥 Targets: {format_targets(session.target_channels)}\n"
         f"📊 Forwarded: {session.forward_count} messages\n"
         f"⚡ Current Mode: {current_mode}\n\n"
         f"**Select a mode:**",
@@ -356,7 +1777,7 @@ async def show_modes(event):
 async def mode_live(event):
     """Enable live forwarding mode"""
     session = get_session(event.sender_id)
-    session.mode = 'live'
+    session.set_mode('live')
     save_session(event.sender_id)
     
     await event.answer("✅ Live mode enabled!")
@@ -373,80 +1794,924 @@ async def mode_send_all(event):
     """Send all files and messages from source to target"""
     session = get_session(event.sender_id)
     
-    await event.answer("⏳ Starting...")
+    await event.answer("🧮 Planning...")
     buttons = [[Button.inline("🔙 Back to Modes", b"modes")]]
     try:
         await event.edit(
             "**📦 Sending ALL Files & Messages**\n\n"
-            "⏳ Fetching all messages from source channel...\n"
-            "This may take a while depending on channel size.",
+            "🧮 Estimating the job, confirm below to start it...",
             buttons=buttons
         )
     except Exception:
         pass  # Ignore if message not modified
     
-    session.mode = 'idle'
-    await forward_all_messages(event.sender_id)
+    session.set_mode('idle')
+    await show_plan(event, 'all')
 
-async def forward_all_messages(user_id):
+async def forward_all_messages(user_id, job=None):
     """Forward all messages from source to target"""
     session = get_session(user_id)
-    session.stop_forwarding = False  # Reset stop flag
+    job = job or new_job(user_id, 'all')
     
     try:
         # Get appropriate client for fetching
         fetch_client = await get_client_for_fetching(user_id)
         
         if not fetch_client:
+            if job.job_id is not None:
+                job.finish('failed')
             return  # Error message already sent
         
-        source = await fetch_client.get_entity(session.source_channel)
-        target = await bot.get_entity(session.target_channel)
+        source, bot_source, targets = await resolve_bulk_peers(fetch_client, session, job)
         
-        forwarded = 0
-        failed = 0
-        
-        await bot.send_message(user_id, "📤 Starting to forward all messages...")
-        
-        async for message in fetch_client.iter_messages(source, reverse=True):
-            # Check if user wants to stop
-            if session.stop_forwarding:
-                await bot.send_message(user_id, "⏸️ Forwarding stopped by user!")
-                session.stop_forwarding = False
-                break
-                
-            try:
-                # Forward message (simple and reliable for all media types)
-                await bot.forward_messages(target, message.id, source)
-                    
-                forwarded += 1
-                session.forward_count += 1
-                
-                # Status update every 50 messages
-                if forwarded % 50 == 0:
-                    await bot.send_message(user_id, f"⏳ Progress: {forwarded} messages forwarded...")
-                    await asyncio.sleep(1)  # Prevent flood
-                    
-            except FloodWaitError as e:
-                logger.warning(f"Flood wait: {e.seconds} seconds")
-                await bot.send_message(user_id, f"⏸️ Rate limited. Waiting {e.seconds} seconds...")
-                await asyncio.sleep(e.seconds)
-            except Exception as e:
-                logger.error(f"Error forwarding message: {e}")
-                failed += 1
-                continue
+        title = f"📤 Resuming after message {job.last_id}" if job.last_id else "📤 Forwarding all messages"
+        await forward_message_batches(
+            job, bot_source, targets,
+            fetch_client.iter_messages(source, min_id=job.last_id, reverse=True),
+            reporter=ProgressReporter(job, title, end_id=await latest_message_id(fetch_client, source)),
+            fetch_client=fetch_client
+        )
         
         save_session(user_id)
         await bot.send_message(
             user_id, 
             f"✅ **Completed!**\n\n"
-            f"📊 Forwarded: {forwarded} messages\n"
-            f"❌ Failed: {failed} messages"
+            f"📊 Forwarded: {job.forwarded} messages\n"
+            f"❌ Failed: {job.failed} messages\n"
+            f"⏭ Already forwarded: {job.skipped}\n"
+            + (f"🚫 Filtered by rules: {job.filtered}\n" if job.filtered else "")
+            + f"⚡ Speed: {format_rate(job.run_forwarded, job.elapsed)}"
+            + format_copy_stats(job)
+            + (f"\n\n🎯 Per target:\n{format_target_stats(job.target_stats)}" if len(job.target_stats) > 1 else "")
+        )
+        
+    except Exception as e:
+        if isinstance(e, ENTITY_ERRORS):
+            entity_cache.invalidate(session.source_channel)
+        job.finish('failed')
+        logger.error(f"Error in forward_all_messages: {e}")
+        await bot.send_message(user_id, f"❌ Error: {str(e)}")
+
+def format_rate(count, elapsed):
+    """Format a messages-per-second figure for completion reports"""
+    rate = count / elapsed if elapsed > 0 else 0.0
+    return f"{rate:.1f} msg/s ({elapsed:.0f}s total)"
+
+def format_duration(seconds):
+    """Format seconds as e.g. 1h 5m, 3m 20s or 45s"""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60}s"
+    return f"{seconds}s"
+
+class ProgressReporter:
+    """One status message per bulk job, edited in place at most every PROGRESS_EDIT_INTERVAL seconds.
+    
+    ETA is estimated from message IDs when the last ID is known (all, range)
+    or from counts when the number of messages is (files). Flood waits are
+    shown in the next edit instead of being sent as new messages.
+    """
+    
+    def __init__(self, job, title, end_id=None, total=None, interval=PROGRESS_EDIT_INTERVAL):
+        self.job = job
+        self.title = title
+        self.end_id = end_id  # Last source message ID the job will reach
+        self.total = total  # Messages the job will handle in all, when known instead
+        self.interval = interval
+        self.message = None
+        self.last_edit = 0.0
+        self.flood_until = 0.0
+        self.started = time.monotonic()
+        self.start_id = job.last_id
+        self.start_messages = job.messages
+    
+    def _eta(self):
+        elapsed = time.monotonic() - self.started
+        if self.total:
+            done, remaining, total = self.job.messages - self.start_messages, self.total - self.job.messages, self.total
+            position = self.job.messages
+        elif self.end_id:
+            done, remaining, total = self.job.last_id - self.start_id, self.end_id - self.job.last_id, self.end_id
+            position = self.job.last_id
+        else:
+            return None
+        percent = min(100, position * 100 // max(1, total))
+        if done <= 0 or elapsed <= 0:
+            return f"{percent}%"
+        return f"{format_duration(max(0, remaining) * elapsed / done)} left ({percent}%)"
+    
+    def render(self, final=None):
+        job = self.job
+        lines = [
+            f"{self.title} (job #{job.job_id})",
+            f"📊 Forwarded: {job.forwarded} | ❌ Failed: {job.failed} | ⏭ Skipped: {job.skipped}",
+            f"⚡ Speed: {format_rate(job.run_forwarded, time.monotonic() - self.started)}"
+        ]
+        if final:
+            lines.append(final)
+        else:
+            eta = self._eta()
+            if eta:
+                lines.append(f"⏳ ETA: {eta}")
+            wait = self.flood_until - time.monotonic()
+            if wait > 0:
+                lines.append(f"⏸️ Rate limited, waiting {wait:.0f}s...")
+        return "\n".join(lines)
+    
+    async def start(self):
+        try:
+            self.message = await bot.send_message(self.job.user_id, self.render())
+        except Exception as e:
+            logger.error(f"Error sending progress message: {e}")
+        self.last_edit = time.monotonic()
+    
+    async def update(self, force=False):
+        """Edit the status message if the last edit is old enough"""
+        now = time.monotonic()
+        if self.message is None or (not force and now - self.last_edit < self.interval):
+            return
+        self.last_edit = now
+        await self._edit(self.render())
+    
+    async def flood(self, seconds):
+        self.flood_until = max(self.flood_until, time.monotonic() + seconds)
+        await self.update()
+    
+    async def finish(self, final):
+        if self.message is not None:
+            await self._edit(self.render(final))
+    
+    async def _edit(self, text):
+        try:
+            await self.message.edit(text)
+        except FloodWaitError as e:
+            self.last_edit = time.monotonic() + e.seconds  # Skip edits until the wait is over
+        except Exception as e:
+            logger.debug(f"Progress edit skipped: {e}")
+
+async def latest_message_id(client, chat):
+    """ID of the newest message in chat, or None if it cannot be read"""
+    try:
+        messages = await client.get_messages(chat, limit=1)
+    except Exception as e:
+        logger.error(f"Error reading latest message: {e}")
+        return None
+    return messages[0].id if messages else None
+
+def format_targets(targets):
+    """Format a list of target channel IDs for display"""
+    return ", ".join(f"`{target}`" for target in targets) or "None"
+
+def format_target_stats(target_stats):
+    """One line per target with its forwarded/failed counts"""
+    return "\n".join(
+        f"  • `{target}`: {forwarded} forwarded, {failed} failed"
+        for target, (forwarded, failed) in target_stats.items()
+    )
+
+async def fan_out(items, deliver):
+    """Run deliver(item) for all items concurrently, at most FANOUT_CONCURRENCY at a time.
+    
+    Returns results in order, with exceptions returned instead of raised.
+    """
+    if len(items) == 1:
+        try:
+            return [await deliver(items[0])]
+        except Exception as e:
+            return [e]
+    
+    semaphore = asyncio.Semaphore(FANOUT_CONCURRENCY)
+    
+    async def deliver_one(item):
+        async with semaphore:
+            return await deliver(item)
+    
+    return await asyncio.gather(*(deliver_one(item) for item in items), return_exceptions=True)
+
+async def resolve_bulk_peers(fetch_client, session, job):
+    """Resolve the peers a bulk job needs: source for fetching, source and targets for the bots.
+    
+    The bots' side is resolved through any bot token that can see the chat;
+    targets are returned as a list of (chat_id, marked peer ID).
+    """
+    source = await entity_cache.get(fetch_client, session.source_channel)
+    bot_source = await resolve_chat_id(session.source_channel)
+    targets = []
+    for chat_id in job.params.get('targets') or session.target_channels:
+        targets.append((chat_id, await resolve_chat_id(chat_id)))
+    return source, bot_source, targets
+
+async def forward_batch(target, source, message_ids, on_flood=None):
+    """Forward a batch of message IDs from source to target chat in one rate-limited request.
+    
+    Returns (forwarded_ids, failed_ids). Flood waits are retried by the rate
+    limiter, on another bot token when one is free; ENTITY_ERRORS are
+    propagated because no message in the job can be forwarded once a chat is
+    inaccessible.
+    """
+    async def forward(client, peer):
+        return await client.forward_messages(peer, message_ids, await entity_cache.get(client, source))
+    
+    try:
+        result = await send_via_bots(target, forward, count=len(message_ids), on_flood=on_flood)
+    except (*ENTITY_ERRORS, ChatForwardsRestrictedError):
+        raise
+    except Exception as e:
+        if len(message_ids) == 1:
+            logger.error(f"Error forwarding message {message_ids[0]}: {e}")
+            return [], list(message_ids)
+        
+        # Isolate the failing messages by retrying the batch one by one
+        logger.warning(f"Batch of {len(message_ids)} failed ({e}), retrying individually")
+        forwarded, failed = [], []
+        for msg_id in message_ids:
+            ok, bad = await forward_batch(target, source, [msg_id], on_flood=on_flood)
+            forwarded += ok
+            failed += bad
+        return forwarded, failed
+    
+    if not isinstance(result, list):
+        result = [result]
+    
+    forwarded, failed = [], []
+    for msg_id, sent in zip(message_ids, result):
+        if sent:
+            forwarded.append(msg_id)
+        else:
+            logger.error(f"Message {msg_id} was not forwarded")
+            failed.append(msg_id)
+    return forwarded, failed
+
+async def copy_batch(target, source, messages, rules, on_flood=None):
+    """Send messages to target as copies with their captions rewritten by rules.
+    
+    The bot re-reads each message from source, since media fetched by the
+    user client cannot be sent by the bot. Returns (copied_ids, failed_ids).
+    """
+    copied, failed = [], []
+    for message in messages:
+        async def copy(client, peer):
+            original = await client.get_messages(await entity_cache.get(client, source), ids=message.id)
+            if original is None:
+                raise ValueError(f"message {message.id} is not visible to the bot")
+            text, entities = rules.caption(original)
+            return await client.send_message(peer, text, file=original.media, formatting_entities=entities)
+        
+        try:
+            await send_via_bots(target, copy, on_flood=on_flood)
+        except (*ENTITY_ERRORS, ChatForwardsRestrictedError):
+            raise
+        except Exception as e:
+            logger.error(f"Error copying message {message.id}: {e}")
+            failed.append(message.id)
+        else:
+            copied.append(message.id)
+    return copied, failed
+
+class TransferBudget:
+    """Bounds the bytes held in memory by copy-mode transfers across all jobs.
+    
+    Waiters are served in arrival order, so a large file is not starved by
+    smaller ones queued behind it. Requests are whole files up to
+    BIG_FILE_SIZE or single parts of streamed ones, so they always fit in
+    the budget.
+    """
+    
+    def __init__(self, limit=COPY_BUFFER_BYTES):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self._waiters = deque()
+        self._changed = asyncio.Condition()
+    
+    async def acquire(self, size):
+        """Wait for size bytes; returns the amount to pass to release()"""
+        size = max(size, 1)
+        if size > self.limit:
+            raise ValueError(f"{size} bytes do not fit in the copy buffer of {self.limit} bytes")
+        async with self._changed:
+            ticket = object()
+            self._waiters.append(ticket)
+            try:
+                await self._changed.wait_for(
+                    lambda: self._waiters[0] is ticket and self.used + size <= self.limit
+                )
+            finally:
+                self._waiters.remove(ticket)
+                self._changed.notify_all()
+            self.used += size
+            self.peak = max(self.peak, self.used)
+        return size
+    
+    async def release(self, size):
+        async with self._changed:
+            self.used -= size
+            self._changed.notify_all()
+
+copy_budget = TransferBudget()
+
+async def hold_buffer(job, size):
+    """Take size bytes of copy_budget for a job; returns the amount to pass to release_buffer()"""
+    held = await copy_budget.acquire(size)
+    job.buffer_held += held
+    job.buffer_peak = max(job.buffer_peak, job.buffer_held)
+    return held
+
+async def release_buffer(job, held):
+    job.buffer_held -= held
+    await copy_budget.release(held)
+
+def is_streamed(message):
+    """Whether copy mode streams a message's file part by part instead of holding it whole"""
+    return isinstance(message.media, MessageMediaDocument) and bool(message.file and message.file.size) \
+        and message.file.size > BIG_FILE_SIZE
+
+async def download_to_buffer(client, message):
+    """Download a message's media into memory, documents as parallel ranged requests"""
+    document = message.document
+    size = message.file.size if message.file and message.file.size else 0
+    if document is None or size <= COPY_CHUNK_SIZE:
+        return bytearray(await client.download_media(message, file=bytes))
+    
+    buffer = bytearray(size)
+    chunks = -(-size // COPY_CHUNK_SIZE)
+    workers = min(COPY_CHUNK_WORKERS, chunks)
+    per_worker = -(-chunks // workers)
+    
+    async def fetch(first_chunk):
+        offset = first_chunk * COPY_CHUNK_SIZE
+        async for data in client.iter_download(
+            document, offset=offset, limit=per_worker, request_size=COPY_CHUNK_SIZE, file_size=size
+        ):
+            buffer[offset:offset + len(data)] = data
+            offset += len(data)
+    
+    await asyncio.gather(*(fetch(first) for first in range(0, chunks, per_worker)))
+    return buffer
+
+def upload_part_size(size):
+    """COPY_CHUNK_SIZE, doubled up to 512 KB until a file of size bytes fits in UPLOAD_MAX_PARTS parts"""
+    part_size = COPY_CHUNK_SIZE
+    while -(-size // part_size) > UPLOAD_MAX_PARTS and part_size < 512 * 1024:
+        part_size *= 2
+    if -(-size // part_size) > UPLOAD_MAX_PARTS:
+        raise ValueError(f"File of {size} bytes is too large to upload in {UPLOAD_MAX_PARTS} parts")
+    return part_size
+
+async def upload_buffer(client, data, name):
+    """Upload bytes from memory as parallel file part requests; returns the InputFile to send"""
+    size = len(data)
+    part_size = upload_part_size(size)
+    parts = max(1, -(-size // part_size))
+    big = size > BIG_FILE_SIZE
+    file_id = helpers.generate_random_long()
+    view = memoryview(data)
+    pending = iter(range(parts))
+    
+    async def send_parts():
+        for part in pending:
+            chunk = bytes(view[part * part_size:(part + 1) * part_size])
+            if big:
+                request = SaveBigFilePartRequest(file_id, part, parts, chunk)
+            else:
+                request = SaveFilePartRequest(file_id, part, chunk)
+            if not await client(request):
+                raise RuntimeError(f"Telegram rejected part {part} of {name}")
+    
+    await asyncio.gather(*(send_parts() for _ in range(min(COPY_CHUNK_WORKERS, parts))))
+    if big:
+        return InputFileBig(file_id, parts, name)
+    return InputFile(file_id, parts, name, hashlib.md5(view).hexdigest())
+
+async def stream_document(job, fetch_client, client, message, name):
+    """Copy a big document part by part: fetch_client downloads each part and client uploads it.
+    
+    At most COPY_CHUNK_WORKERS parts are in memory at a time, each charged
+    to copy_budget while held. Returns the InputFileBig to send.
+    """
+    document = message.document
+    size = message.file.size
+    part_size = upload_part_size(size)
+    parts = -(-size // part_size)
+    file_id = helpers.generate_random_long()
+    per_worker = -(-parts // min(COPY_CHUNK_WORKERS, parts))
+    
+    async def copy_parts(first):
+        last = min(first + per_worker, parts)
+        chunks = fetch_client.iter_download(
+            document, offset=first * part_size, limit=last - first, request_size=part_size, file_size=size
         )
+        for part in range(first, last):
+            held = await hold_buffer(job, part_size)
+            try:
+                chunk = await chunks.__anext__()
+                job.copied_bytes[0] += len(chunk)
+                metrics.inc('forwarder_copied_bytes_total', len(chunk), direction='download')
+                if not await client(SaveBigFilePartRequest(file_id, part, parts, chunk)):
+                    raise RuntimeError(f"Telegram rejected part {part} of {name}")
+            finally:
+                await release_buffer(job, held)
+    
+    await asyncio.gather(*(copy_parts(first) for first in range(0, parts, per_worker)))
+    return InputFileBig(file_id, parts, name)
+
+def uploaded_media(message, input_file):
+    """InputMedia for re-sending a message's photo or document from an uploaded file"""
+    if message.photo:
+        return InputMediaUploadedPhoto(input_file)
+    document = message.document
+    return InputMediaUploadedDocument(
+        input_file, mime_type=document.mime_type or 'application/octet-stream', attributes=document.attributes
+    )
+
+FILE_REFERENCE_ERRORS = (FileReferenceExpiredError, FileReferenceInvalidError, FileReferenceEmptyError)
+# A previously uploaded file that can no longer be sent from its parts
+UPLOAD_ERRORS = (FilePartMissingError, FilePartsInvalidError, FileIdInvalidError, MediaEmptyError)
+
+def media_key(message):
+    """Source photo or document identity used by upload_cache, None for text and link previews"""
+    media = message_file(message)
+    if media is None:
+        return None
+    return ('photo' if isinstance(message.media, MessageMediaPhoto) else 'document', media.id)
+
+class UploadCache:
+    """LRU of media each bot token already uploaded, keyed by the source photo or document.
+    
+    An entry holds what the last send returned: the uploaded InputFile
+    while no send with it has succeeded yet (so a retry does not upload
+    again), then the sent message's InputMedia and where that message is,
+    so sends to other chats and later jobs are metadata-only. When the
+    file reference expires, it is refreshed by re-reading that message.
+    """
+    
+    def __init__(self, max_size=MEDIA_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # (client, kind, media id) -> (InputFile or InputMedia, (peer, msg_id) or None)
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+        self.saved_bytes = 0  # Upload bytes avoided by hits
+    
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+    
+    def put(self, key, media, location=None):
+        self._entries[key] = (media, location)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def drop(self, key):
+        self._entries.pop(key, None)
+    
+    def has_media(self, media):
+        """Whether any bot token has this (kind, media id) cached"""
+        return any((token.client, *media) in self._entries for token in sender_bots)
+    
+    async def refresh(self, client, key):
+        """Re-read the message a cached media was sent in for a fresh file reference; None if gone"""
+        media, location = self._entries.get(key, (None, None))
+        if location is None:
+            return None
+        peer, msg_id = location
+        message = await client.get_messages(peer, ids=msg_id)
+        if message is None or message.media is None:
+            self.drop(key)
+            return None
+        media = utils.get_input_media(message.media)
+        self.put(key, media, location)
+        self.refreshes += 1
+        return media
+    
+    def stats(self):
+        return {
+            'size': len(self._entries), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses,
+            'refreshes': self.refreshes, 'evictions': self.evictions, 'saved_bytes': self.saved_bytes
+        }
+
+upload_cache = UploadCache()
+
+async def send_media_copy(client, peer, message, text, entities, upload, size):
+    """Send a copy of message's media through client, reusing upload_cache where possible.
+    
+    upload() uploads the file through client and returns (InputFile,
+    uploaded bytes); it is only awaited when the cache cannot be used.
+    """
+    key = (client, *media_key(message))
+    cached = upload_cache.get(key)
+    if cached is not None:
+        media, location = cached
+        if isinstance(media, (InputFile, InputFileBig)):
+            media = uploaded_media(message, media)
+        try:
+            try:
+                sent = await client.send_message(peer, text, file=media, formatting_entities=entities)
+            except FILE_REFERENCE_ERRORS:
+                media = await upload_cache.refresh(client, key)
+                if media is None:
+                    raise
+                sent = await client.send_message(peer, text, file=media, formatting_entities=entities)
+        except (*FILE_REFERENCE_ERRORS, *UPLOAD_ERRORS) as e:
+            logger.info(f"Cached upload of message {message.id} is no longer usable, uploading again: {e}")
+            upload_cache.drop(key)
+        else:
+            upload_cache.saved_bytes += size
+            upload_cache.put(key, utils.get_input_media(sent.media), (peer, sent.id))
+            return sent, 0
+    
+    input_file, uploaded = await upload()
+    upload_cache.put(key, input_file)  # A retry after a failed send reuses the parts
+    sent = await client.send_message(peer, text, file=uploaded_media(message, input_file), formatting_entities=entities)
+    upload_cache.put(key, utils.get_input_media(sent.media), (peer, sent.id))
+    return sent, uploaded
+
+async def send_album_media_copy(client, peer, parts):
+    """Send (message, text, entities, upload, size) parts as one album, reusing upload_cache where possible.
+    
+    Albums only take media sent by ID, so a file that has to be uploaded is
+    turned into a photo or document with UploadMediaRequest first. If a
+    cached part is no longer usable, the parts are uploaded again once.
+    Returns (result, uploaded bytes per part).
+    """
+    for attempt in range(2):
+        multi_media, uploads = [], []
+        for message, text, entities, upload, size in parts:
+            key = (client, *media_key(message))
+            cached = upload_cache.get(key)
+            uploaded = 0
+            if cached is not None and not isinstance(cached[0], (InputFile, InputFileBig)):
+                media = cached[0]
+                upload_cache.saved_bytes += size
+            else:
+                if cached is not None:
+                    input_file = cached[0]
+                else:
+                    input_file, uploaded = await upload()
+                    upload_cache.put(key, input_file)  # A retry after a failed send reuses the parts
+                media = utils.get_input_media(
+                    await client(UploadMediaRequest(peer, media=uploaded_media(message, input_file)))
+                )
+                upload_cache.put(key, media)
+            multi_media.append(InputSingleMedia(
+                media=media, random_id=helpers.generate_random_long(), message=text, entities=entities
+            ))
+            uploads.append(uploaded)
+        try:
+            return await client(SendMultiMediaRequest(peer=peer, multi_media=multi_media)), uploads
+        except (*FILE_REFERENCE_ERRORS, *UPLOAD_ERRORS) as e:
+            if attempt:
+                raise
+            logger.info(f"Cached uploads of album {parts[0][0].grouped_id} are no longer usable, uploading again: {e}")
+            for message, *_ in parts:
+                upload_cache.drop((client, *media_key(message)))
+
+async def copy_protected(job, fetch_client, targets, source, messages, rules=None, on_flood=None):
+    """Copy messages to every target for a source with forwarding restricted.
+    
+    The bot uploads each file for the first target and reuses the upload
+    for the others through upload_cache; files already in the cache are
+    not downloaded at all. Files up to BIG_FILE_SIZE are downloaded whole
+    by the user client, within copy_budget and up to COPY_CONCURRENCY
+    messages ahead; bigger documents are streamed with stream_document
+    when they are sent. Albums are sent as albums, everything in source
+    order. Returns, per target, (copied_ids, failed_ids) or the
+    ENTITY_ERRORS exception that made the target unusable.
+    """
+    results = {chat_id: ([], []) for chat_id, _ in targets}
+    started = time.monotonic()
+    wanted = [
+        [chat_id for chat_id, _ in targets if dedup_index.filter_new(chat_id, source, [message])]
+        for message in messages
+    ]
+    
+    streamed = [is_streamed(message) for message in messages]
+    
+    async def fetch(message):
+        held = await hold_buffer(job, message.file.size if message.file and message.file.size else COPY_CHUNK_SIZE)
+        try:
+            data = await download_to_buffer(fetch_client, message)
+        except BaseException:
+            await release_buffer(job, held)
+            raise
+        job.copied_bytes[0] += len(data)
+        metrics.inc('forwarder_copied_bytes_total', len(data), direction='download')
+        return data, held
+    
+    downloads = {}
+    
+    def start_download(index):
+        if index not in downloads:
+            downloads[index] = asyncio.create_task(fetch(messages[index]))
+        return downloads[index]
+    
+    def prefetch(index):
+        """Start downloading the files from index up to COPY_CONCURRENCY messages ahead"""
+        for ahead in range(index, min(index + COPY_CONCURRENCY + 1, len(messages))):
+            if streamed[ahead]:
+                break  # Budget held for later files could keep its parts waiting
+            key = media_key(messages[ahead])
+            if wanted[ahead] and key and not upload_cache.has_media(key):
+                start_download(ahead)
+    
+    async def release(index):
+        task = downloads.pop(index, None)
+        if task is None:
+            return
+        task.cancel()
+        try:
+            data, held = await task
+        except BaseException:
+            return  # fetch() already gave its budget back
+        await release_buffer(job, held)
+    
+    async def upload(client, index):
+        """Upload a message's file through client; returns (InputFile, uploaded bytes)"""
+        message = messages[index]
+        name = message.file.name or f"{message.id}{message.file.ext or ''}"
+        if streamed[index]:
+            return await stream_document(job, fetch_client, client, message, name), message.file.size
+        if index not in downloads:
+            # Not prefetched (cached, or further into an album than the window): give back what this
+            # job holds for later messages first, or the download could wait in copy_budget for this very job
+            for later in [later for later in downloads if later > index]:
+                await release(later)
+        data, held = await start_download(index)
+        try:
+            return await upload_buffer(client, data, name), len(data)
+        finally:
+            # Retries and other targets use the upload; another bot needing the bytes downloads them again
+            await release(index)
+            prefetch(index + 1)
+    
+    # Runs of message indexes sent together: an album, or a single message
+    units = []
+    for index, message in enumerate(messages):
+        grouped_id = getattr(message, 'grouped_id', None)
+        if grouped_id and units and len(units[-1]) < 10 and getattr(messages[units[-1][-1]], 'grouped_id', None) == grouped_id:
+            units[-1].append(index)
+        else:
+            units.append([index])
+    
+    def count_uploads(uploads):
+        for uploaded in uploads:
+            if uploaded:
+                job.copied_bytes[1] += uploaded
+                metrics.inc('forwarder_copied_bytes_total', uploaded, direction='upload')
+            else:
+                job.copy_reused += 1
+    
+    try:
+        for unit in units:
+            prefetch(unit[0])
+            job.skipped += sum(len(targets) - len(wanted[index]) for index in unit)
+            # The parts of the unit each usable target has not received yet
+            parts = {
+                chat_id: [index for index in unit if chat_id in wanted[index]]
+                for chat_id, _ in targets if not isinstance(results[chat_id], Exception)
+            }
+            chat_ids = [chat_id for chat_id, indexes in parts.items() if indexes]
+            if not chat_ids:
+                continue
+            captions = {
+                index: rules.caption(messages[index]) if rules else (messages[index].message or "", messages[index].entities)
+                for index in unit
+            }
+            
+            async def send(client, peer, indexes):
+                """Send the given messages of the unit through client, as an album when there are several"""
+                def copy_part(index):
+                    message = messages[index]
+                    size = message.file.size if message.file and message.file.size else 0
+                    return (message, *captions[index], lambda: upload(client, index), size)
+                
+                if len(indexes) > 1:
+                    sent, uploads = await send_album_media_copy(client, peer, [copy_part(index) for index in indexes])
+                    count_uploads(uploads)
+                    return sent
+                message, text, entities, part_upload, size = copy_part(indexes[0])
+                if not media_key(message):
+                    return await client.send_message(peer, text, formatting_entities=entities)
+                sent, uploaded = await send_media_copy(client, peer, message, text, entities, part_upload, size)
+                count_uploads([uploaded])
+                return sent
+            
+            async def deliver(chat_id, send=send, parts=parts):
+                return await send_via_bots(
+                    chat_id, lambda client, peer: send(client, peer, parts[chat_id]),
+                    count=len(parts[chat_id]), on_flood=on_flood
+                )
+            
+            try:
+                # The first target uploads; the others reuse that upload from upload_cache
+                sent = await fan_out(chat_ids[:1], deliver)
+                sent += await fan_out(chat_ids[1:], deliver)
+            finally:
+                for index in unit:
+                    await release(index)
+            for chat_id, result in zip(chat_ids, sent):
+                copied = [messages[index] for index in parts[chat_id]]
+                if isinstance(result, ENTITY_ERRORS):
+                    results[chat_id] = result
+                elif isinstance(result, Exception):
+                    logger.error(f"Error copying messages {[message.id for message in copied]} to {chat_id}: {result}")
+                    results[chat_id][1].extend(message.id for message in copied)
+                else:
+                    results[chat_id][0].extend(message.id for message in copied)
+                    dedup_index.add(chat_id, source, copied)
+    finally:
+        for index in list(downloads):
+            await release(index)
+        job.copy_seconds += time.monotonic() - started
+    return [results[chat_id] for chat_id, _ in targets]
+
+def format_copy_stats(job):
+    """Completion report line for jobs that used copy mode, or an empty string"""
+    down, up = job.copied_bytes
+    if not down and not up and not job.copy_reused:
+        return ""
+    rate = (down + up) / job.copy_seconds / 2 ** 20 if job.copy_seconds else 0.0
+    return (
+        f"\n📦 Copied: {down / 2 ** 20:.1f} MB down, {up / 2 ** 20:.1f} MB up, {rate:.1f} MB/s, "
+        f"peak buffer {job.buffer_peak / 2 ** 20:.1f} MB, {job.copy_reused} files sent without re-uploading"
+    )
+
+def split_trailing_album(batch):
+    """Split off the trailing album parts of a full batch so the album is forwarded in one request"""
+    grouped_id = getattr(batch[-1], 'grouped_id', None)
+    if not grouped_id:
+        return batch, []
+    
+    cut = len(batch)
+    while cut > 0 and getattr(batch[cut - 1], 'grouped_id', None) == grouped_id:
+        cut -= 1
+    if cut == 0:
+        return batch, []  # The whole batch is one album (batch size below 10)
+    return batch[:cut], batch[cut:]
+
+async def forward_message_batches(job, source, targets, messages, limit=None, reporter=None, fetch_client=None):
+    """Forward messages from an async iterator in batches of FORWARD_BATCH_SIZE
+    
+    Fetching runs in a producer task that fills a bounded queue, so the user
+    client downloads the next history pages while the bot forwards the
+    current batch. Each batch is fetched once and forwarded to all targets
+    concurrently. Progress is accumulated on the job, which is checkpointed
+    as it goes and marked done at the end, and shown through reporter.
+    
+    With rules on the job, messages failing the filters are dropped before
+    fan-out and messages whose caption is rewritten are sent as copies.
+    If the source turns out to restrict forwarding, the rest of the job is
+    copied through fetch_client with copy_protected.
+    """
+    user_id = job.user_id
+    session = get_session(user_id)
+    rules = CompiledRules(job.params['rules']) if job.params.get('rules') else None
+    batches = asyncio.Queue(maxsize=FORWARD_PREFETCH_BATCHES)
+    
+    job.checkpoint()  # Persist the job before the first batch so it can be resumed
+    active_jobs[job.job_id] = job
+    
+    async def produce():
+        queued = 0
+        batch = []
+        try:
+            async for message in messages:
+                if limit is not None and queued >= limit:
+                    break
+                batch.append(message)
+                queued += 1
+                if len(batch) >= FORWARD_BATCH_SIZE:
+                    # An album may continue in the next message, so keep its parts together
+                    batch, album = split_trailing_album(batch)
+                    await batches.put(batch)  # Blocks while the queue is full
+                    batch = album
+            if batch:
+                await batches.put(batch)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            await batches.put(None)  # Wake the consumer, which re-raises via `await producer`
+            raise
+        await batches.put(None)
+    
+    reporter = reporter or ProgressReporter(job, "📤 Forwarding")
+    await reporter.start()
+    
+    async def notify_flood(seconds):
+        await reporter.flood(seconds)
+    
+    source_id = utils.get_peer_id(source)
+    
+    async def deliver(target, batch, rewritten):
+        """Forward the part of a batch the target has not received yet"""
+        chat_id, peer = target
+        fresh = dedup_index.filter_new(chat_id, source_id, batch)
+        job.skipped += len(batch) - len(fresh)
+        if not fresh:
+            return [], []
+        ok, bad = [], []
+        # Consecutive runs of plain forwards and rewritten copies, so the target keeps the source order
+        start = 0
+        while start < len(fresh):
+            copying = fresh[start].id in rewritten
+            end = start
+            while end < len(fresh) and (fresh[end].id in rewritten) == copying:
+                end += 1
+            if copying:
+                done, failed = await copy_batch(chat_id, source_id, fresh[start:end], rules, on_flood=notify_flood)
+            else:
+                done, failed = await forward_batch(
+                    chat_id, source_id, [message.id for message in fresh[start:end]], on_flood=notify_flood
+                )
+            ok += done
+            bad += failed
+            start = end
+        delivered = set(ok)
+        dedup_index.add(chat_id, source_id, [message for message in fresh if message.id in delivered])
+        return ok, bad
+    
+    copying = False  # Set once the source turns out to restrict forwarding
+    
+    async def flush(batch):
+        nonlocal copying
+        message_ids = [message.id for message in batch]
+        selected, rewritten = batch, set()
+        if rules is not None:
+            selected = [message for message in batch if rules.matches(message)]
+            job.filtered += len(batch) - len(selected)
+            if rules.rewrites:
+                rewritten = {
+                    message.id for message in selected
+                    if rules.transform(message.message or "") != (message.message or "")
+                }
+        results = []
+        if selected and not copying:
+            skipped = job.skipped
+            results = await fan_out(list(targets), lambda target: deliver(target, selected, rewritten))
+            if fetch_client is not None and any(isinstance(result, ChatForwardsRestrictedError) for result in results):
+                copying = True
+                job.skipped = skipped  # The batch is counted again below
+                logger.info(f"Source of job {job.job_id} restricts forwarding, copying instead")
+                await bot.send_message(
+                    user_id,
+                    "🔒 The source channel restricts forwarding, so messages are downloaded and "
+                    "re-uploaded instead. This is slower."
+                )
+        if selected and copying:
+            results = await copy_protected(job, fetch_client, list(targets), source_id, selected, rules, notify_flood)
         
-    except Exception as e:
-        logger.error(f"Error in forward_all_messages: {e}")
-        await bot.send_message(user_id, f"❌ Error: {str(e)}")
+        for (chat_id, peer), result in zip(list(targets), results):
+            if isinstance(result, Exception):
+                job.record(chat_id, [], [message.id for message in selected])
+                if not isinstance(result, ENTITY_ERRORS):
+                    raise result
+                # This target is unusable; keep going with the others
+                entity_cache.invalidate(chat_id)
+                targets.remove((chat_id, peer))
+                logger.error(f"Dropping target {chat_id} from job {job.job_id}: {result}")
+                await bot.send_message(user_id, f"❌ Target `{chat_id}` removed from this job: {result}")
+                if not targets:
+                    raise result
+                continue
+            ok, bad = result
+            job.record(chat_id, ok, bad)
+            session.forward_count += len(ok)
+        job.advance(len(message_ids), message_ids[-1])
+        mark_session_dirty(user_id)
+        
+        await reporter.update()
+    
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            batch = await batches.get()
+            if batch is None:
+                break
+            await flush(batch)
+        await producer  # Re-raises any error hit while fetching
+    except asyncio.CancelledError:
+        if job.cancel_requested:
+            await reporter.finish("⏸️ Stopped")
+        raise
+    except Exception:
+        await reporter.finish("❌ Stopped by an error")
+        raise
+    finally:
+        producer.cancel()
+    
+    await reporter.finish("✅ Done")
+    job.finish('done')
+    return job
 
 @bot.on(events.CallbackQuery(pattern=b"mode_range"))
 async def mode_range(event):
@@ -459,7 +2724,7 @@ async def mode_range(event):
         "Or send single number to forward from that message till latest."
     )
     session = get_session(event.sender_id)
-    session.mode = 'awaiting_range'
+    session.set_mode('awaiting_range')
 
 @bot.on(events.CallbackQuery(pattern=b"mode_till_msg"))
 async def mode_till_msg(event):
@@ -471,7 +2736,7 @@ async def mode_till_msg(event):
         "Example: `500` to forward all messages up to message 500"
     )
     session = get_session(event.sender_id)
-    session.mode = 'awaiting_till_msg'
+    session.set_mode('awaiting_till_msg')
 
 @bot.on(events.CallbackQuery(pattern=b"mode_till_file"))
 async def mode_till_file(event):
@@ -480,25 +2745,59 @@ async def mode_till_file(event):
     await event.respond(
         "**📁 Forward Till File Number**\n\n"
         "Send the number of files to forward.\n"
-        "Example: `50` to forward the first 50 files"
+        "Example: `50` to forward the first 50 files, `0` for all files"
+    )
+    session = get_session(event.sender_id)
+    session.pending_media_type = 'all'
+    session.set_mode('awaiting_till_file')
+
+@bot.on(events.CallbackQuery(pattern=b"mode_media_type"))
+async def mode_media_type(event):
+    """Show media type choices"""
+    buttons = [
+        [Button.inline(label, f"media_type:{key}".encode())]
+        for key, (label, _) in MEDIA_FILTERS.items()
+    ]
+    buttons.append([Button.inline("🔙 Back to Modes", b"modes")])
+    await event.edit(
+        "**🎞 Forward By Media Type**\n\n"
+        "Only messages of the chosen type are fetched from the source channel.\n\n"
+        "**Select a media type:**",
+        buttons=buttons
+    )
+
+@bot.on(events.CallbackQuery(pattern=b"media_type:"))
+async def media_type_selected(event):
+    """Prompt for file count of the chosen media type"""
+    media_type = event.data.decode().split(':', 1)[1]
+    if media_type not in MEDIA_FILTERS:
+        await event.answer("❌ Unknown media type", alert=True)
+        return
+    
+    await event.answer()
+    await event.respond(
+        f"**{MEDIA_FILTERS[media_type][0]}**\n\n"
+        "Send the number of files to forward.\n"
+        "Example: `50` to forward the first 50, `0` for all of them"
     )
     session = get_session(event.sender_id)
-    session.mode = 'awaiting_till_file'
+    session.pending_media_type = media_type
+    session.set_mode('awaiting_till_file')
 
 @bot.on(events.CallbackQuery(pattern=b"mode_stop"))
 async def mode_stop(event):
     """Stop forwarding"""
     session = get_session(event.sender_id)
-    session.mode = 'idle'
-    session.stop_forwarding = True  # Signal to stop ongoing forwarding
+    session.set_mode('idle')
     save_session(event.sender_id)
+    cancelled = job_manager.cancel_user(event.sender_id)
     
     await event.answer("⏸️ Stopping forwarding...")
     buttons = [[Button.inline("🔙 Back to Modes", b"modes")]]
     try:
         await event.edit(
             "**⏸️ Forwarding Stopped**\n\n"
-            "Ongoing forwarding will stop at the next message.",
+            f"Live mode is off and {cancelled} bulk job(s) were cancelled.",
             buttons=buttons
         )
     except Exception:
@@ -510,7 +2809,7 @@ async def show_status(event):
     session = get_session(event.sender_id)
     
     source = session.source_channel if session.source_channel else "❌ Not set"
-    target = session.target_channel if session.target_channel else "❌ Not set"
+    target = format_targets(session.target_channels) if session.target_channels else "❌ Not set"
     phone = session.user_phone or "❌ Not set"
     
     mode_text = {
@@ -519,15 +2818,60 @@ async def show_status(event):
         'selective': '📝 Selective Mode'
     }.get(session.mode, session.mode)
     
+    jobs = job_manager.user_jobs(event.sender_id)
+    if jobs:
+        jobs_text = "\n".join(
+            f"• #{job.job_id} {job.kind}: {state}, {job.forwarded} forwarded, {job.failed} failed"
+            for job, state in jobs
+        )
+    else:
+        jobs_text = "• None"
+    
+    target_lines = []
+    for target_id in session.target_channels:
+        forwarded, failed = session.target_stats.get(target_id, (0, 0))
+        try:
+            chat_id = await resolve_chat_id(target_id)  # Limiters are keyed by the marked ID
+        except Exception as e:
+            logger.error(f"Error resolving target {target_id}: {e}")
+            chat_id = None
+        # Summed over the bot tokens that have sent there
+        limiters = [rate_limiters.get((token.client, chat_id)) for token in sender_bots] if chat_id else []
+        stats = [limiter.stats() for limiter in limiters if limiter]
+        if stats:
+            rate_text = (
+                f"{sum(item['rate'] for item in stats):.2f} req/s, {sum(item['tokens'] for item in stats):.1f} tokens, "
+                f"{sum(item['flood_waits'] for item in stats)} flood waits"
+            )
+        else:
+            rate_text = "rate limit not active"
+        send_times = live_latency.percentiles(live_latency.targets.get(target_id))
+        if send_times:
+            rate_text += f", send p95 {send_times[1] * 1000:.0f} ms"
+        target_lines.append(f"• `{target_id}`: {forwarded} ✅ / {failed} ❌ ({rate_text})")
+    targets_text = "\n".join(target_lines) or "• None"
+    latency_text = "\n".join(
+        f"• {stage}: {p50 * 1000:.0f} / {p95 * 1000:.0f} / {p99 * 1000:.0f} ms"
+        for stage, (p50, p95, p99) in live_latency.summary().items()
+    ) or "• No live messages yet"
+    pool = client_pool.stats()
+    
     buttons = [[Button.inline("🔙 Back", b"main_menu")]]
     
     await event.edit(
         f"**📊 Bot Status**\n\n"
         f"📤 **Source Channel:** `{source}`\n"
-        f"📥 **Target Channel:** `{target}`\n"
+        f"📥 **Target Channels:** {target}\n"
         f"📱 **Phone Number:** `{phone}`\n"
         f"⚡ **Mode:** {mode_text}\n"
-        f"📊 **Messages Forwarded:** {session.forward_count}\n\n"
+        f"📊 **Messages Forwarded:** {session.forward_count}\n"
+        f"🎯 **Live Delivery per Target:**\n{targets_text}\n"
+        f"🗂 **Bulk Jobs** ({len(job_manager.running)} running, {len(job_manager.queue)} queued overall):\n"
+        f"{jobs_text}\n"
+        f"⏱ **Live Latency** (p50 / p95 / p99):\n{latency_text}\n"
+        f"🤖 **Bot Tokens:**\n{format_bot_tokens()}\n"
+        f"🔌 **User Clients:** {pool['size']}/{pool['max_size']} connected, {pool['hits']} reused, "
+        f"{pool['evictions']} evicted, {pool['connect_ms']:.0f} ms avg connect\n\n"
         f"🟢 **Bot Status:** Active",
         buttons=buttons
     )
@@ -547,7 +2891,8 @@ async def show_help(event):
         "• **Live Mode** - Auto-forward all new messages\n"
         "• **Message Range** - Forward specific message range\n"
         "• **Till Message** - Forward up to a message number\n"
-        "• **Till File** - Forward specific number of files\n\n"
+        "• **Till File** - Forward specific number of files\n"
+        "• **By Media Type** - Forward only photos, videos, documents...\n\n"
         "**Features:**\n"
         "✅ Removes forwarded tag\n"
         "✅ Forwards all media types\n"
@@ -557,53 +2902,46 @@ async def show_help(event):
         buttons=buttons
     )
 
-@bot.on(events.NewMessage)
-async def message_handler(event):
-    """Handle incoming messages"""
-    if not is_admin(event.sender_id):
-        return
-    
-    session = get_session(event.sender_id)
-    
-    # Handle setting source channel
-    if session.mode == 'awaiting_source':
-        try:
-            channel_input = event.message.text.strip()
-            if event.message.forward:
-                channel = await bot.get_entity(event.message.forward.chat)
-                channel_input = channel.id
-            
-            # Convert string IDs to integers
-            if isinstance(channel_input, str) and channel_input.lstrip('-').isdigit():
-                channel_input = int(channel_input)
-            
-            entity = await bot.get_entity(channel_input)
-            channel_id = entity.id if hasattr(entity, 'id') else channel_input
-            
-            # Check if bot is admin
-            is_admin_perm, msg = await check_bot_permissions(channel_id, "source")
-            if not is_admin_perm:
-                await event.respond(msg)
-                session.mode = 'idle'
-                return
-            
-            session.source_channel = channel_id
-            save_session(event.sender_id)
-            session.mode = 'idle'
-            
-            await event.respond(f"✅ Source channel set: `{session.source_channel}`\n{msg}")
-        except Exception as e:
-            await event.respond(f"❌ Error: {str(e)}\nPlease try again.")
-        return
-    
-    # Handle setting target channel
-    if session.mode == 'awaiting_target':
-        try:
-            channel_input = event.message.text.strip()
-            if event.message.forward:
-                channel = await bot.get_entity(event.message.forward.chat)
-                channel_input = channel.id
-            
+async def handle_source_input(event, session):
+    """Set the source channel from a channel ID, @username or forwarded post"""
+    try:
+        channel_input = event.message.text.strip()
+        if event.message.forward:
+            channel = await bot.get_entity(event.message.forward.chat)
+            channel_input = channel.id
+        
+        # Convert string IDs to integers
+        if isinstance(channel_input, str) and channel_input.lstrip('-').isdigit():
+            channel_input = int(channel_input)
+        
+        entity = await bot.get_entity(channel_input)
+        channel_id = entity.id if hasattr(entity, 'id') else channel_input
+        
+        # Check if bot is admin
+        is_admin_perm, msg = await check_bot_permissions(channel_id, "source")
+        if not is_admin_perm:
+            await event.respond(msg)
+            session.set_mode('idle')
+            return
+        
+        session.source_channel = channel_id
+        save_session(event.sender_id)
+        session.set_mode('idle')
+        
+        await event.respond(f"✅ Source channel set: `{session.source_channel}`\n{msg}")
+    except Exception as e:
+        await event.respond(f"❌ Error: {str(e)}\nPlease try again.")
+
+async def handle_target_input(event, session):
+    """Set or extend the target channels from IDs, @usernames or a forwarded post"""
+    try:
+        channel_inputs = event.message.text.replace(',', ' ').split()
+        if event.message.forward:
+            channel = await bot.get_entity(event.message.forward.chat)
+            channel_inputs = [channel.id]
+        
+        targets = [] if session.mode == 'awaiting_target' else list(session.target_channels)
+        for channel_input in channel_inputs:
             # Convert string IDs to integers
             if isinstance(channel_input, str) and channel_input.lstrip('-').isdigit():
                 channel_input = int(channel_input)
@@ -615,289 +2953,620 @@ async def message_handler(event):
             is_admin_perm, msg = await check_bot_permissions(channel_id, "target")
             if not is_admin_perm:
                 await event.respond(msg)
-                session.mode = 'idle'
+                session.set_mode('idle')
                 return
             
-            session.target_channel = channel_id
+            if channel_id not in targets:
+                targets.append(channel_id)
+        
+        if not targets or len(targets) > MAX_TARGETS:
+            await event.respond(f"❌ Please send between 1 and {MAX_TARGETS} target channels.")
+            session.set_mode('idle')
+            return
+        
+        session.target_channels = targets
+        save_session(event.sender_id)
+        session.set_mode('idle')
+        
+        await event.respond(f"✅ Target channels set: {format_targets(session.target_channels)}\n{msg}")
+    except Exception as e:
+        await event.respond(f"❌ Error: {str(e)}\nPlease try again.")
+
+async def handle_range_input(event, session):
+    """Plan a range job from `START END` or `START`"""
+    try:
+        parts = event.message.text.split()
+        if len(parts) == 2:
+            start, end = int(parts[0]), int(parts[1])
+        else:
+            start, end = int(parts[0]), None
+        
+        session.set_mode('idle')
+        await show_plan(event, 'range', start_id=start, end_id=end)
+    except Exception as e:
+        await event.respond(f"❌ Error: {str(e)}\nPlease send valid numbers.")
+
+async def handle_till_msg_input(event, session):
+    """Plan a job up to a message number"""
+    try:
+        till_msg = int(event.message.text)
+        session.set_mode('idle')
+        await show_plan(event, 'range', start_id=1, end_id=till_msg)
+    except Exception as e:
+        await event.respond(f"❌ Error: {str(e)}\nPlease send a valid number.")
+
+async def handle_till_file_input(event, session):
+    """Queue a files job for a file count"""
+    try:
+        file_count = int(event.message.text)
+        media_type = session.pending_media_type
+        session.set_mode('idle')
+        position = job_manager.submit(
+            new_job(event.sender_id, 'files', file_count=file_count, media_type=media_type)
+        )
+        what = "files" if media_type == 'all' else MEDIA_FILTERS[media_type][0]
+        amount = f"first {file_count}" if file_count else "all"
+        await event.respond(f"⏳ Forwarding {amount} {what}...\n{describe_submission(position)}")
+    except Exception as e:
+        await event.respond(f"❌ Error: {str(e)}\nPlease send a valid number.")
+
+async def handle_phone_input(event, session):
+    """Store the phone number used to log in the user client"""
+    try:
+        phone = event.message.text.strip()
+        
+        # Basic validation
+        if not phone.startswith('+') or not phone[1:].replace(' ', '').isdigit():
+            await event.respond("❌ Invalid phone number format. Please use format: +1234567890")
+            return
+        
+        session.user_phone = phone
+        save_session(event.sender_id)
+        session.set_mode('idle')
+        
+        await event.respond(
+            f"✅ Phone number set: `{phone}`\n\n"
+            "When you use forwarding features, you'll receive a verification code via Telegram.\n"
+            "Just send it to the bot to authorize!"
+        )
+    except Exception as e:
+        await event.respond(f"❌ Error: {str(e)}\nPlease try again.")
+
+async def handle_session_string_input(event, session):
+    """Import and verify a user session string"""
+    try:
+        session_str = event.message.text.strip()
+        
+        # Test the session string
+        test_client = TelegramClient(StringSession(session_str), API_ID, API_HASH)
+        await test_client.connect()
+        
+        if await test_client.is_user_authorized():
+            me = await test_client.get_me()
+            session.session_string = session_str
+            session.user_phone = me.phone
             save_session(event.sender_id)
-            session.mode = 'idle'
-            
-            await event.respond(f"✅ Target channel set: `{session.target_channel}`\n{msg}")
-        except Exception as e:
-            await event.respond(f"❌ Error: {str(e)}\nPlease try again.")
-        return
-    
-    # Handle message range input
-    if session.mode == 'awaiting_range':
-        try:
-            parts = event.message.text.split()
-            if len(parts) == 2:
-                start, end = int(parts[0]), int(parts[1])
-            else:
-                start, end = int(parts[0]), None
-            
-            session.mode = 'idle'
-            await event.respond(f"⏳ Starting to forward messages from {start} to {end or 'latest'}...")
-            await forward_message_range(event.sender_id, start, end)
-        except Exception as e:
-            await event.respond(f"❌ Error: {str(e)}\nPlease send valid numbers.")
-        return
-    
-    # Handle till message input
-    if session.mode == 'awaiting_till_msg':
-        try:
-            till_msg = int(event.message.text)
-            session.mode = 'idle'
-            await event.respond(f"⏳ Starting to forward messages up to {till_msg}...")
-            await forward_message_range(event.sender_id, 1, till_msg)
-        except Exception as e:
-            await event.respond(f"❌ Error: {str(e)}\nPlease send a valid number.")
-        return
-    
-    # Handle till file input
-    if session.mode == 'awaiting_till_file':
-        try:
-            file_count = int(event.message.text)
-            session.mode = 'idle'
-            await event.respond(f"⏳ Starting to forward first {file_count} files...")
-            await forward_files(event.sender_id, file_count)
-        except Exception as e:
-            await event.respond(f"❌ Error: {str(e)}\nPlease send a valid number.")
-        return
-    
-    # Handle phone number input
-    if session.mode == 'awaiting_phone':
-        try:
-            phone = event.message.text.strip()
-            
-            # Basic validation
-            if not phone.startswith('+') or not phone[1:].replace(' ', '').isdigit():
-                await event.respond("❌ Invalid phone number format. Please use format: +1234567890")
-                return
+            session.set_mode('idle')
             
-            session.user_phone = phone
-            save_session(event.sender_id)
-            session.mode = 'idle'
+            # Reuse the connected client for fetching
+            await client_pool.put(event.sender_id, test_client)
             
             await event.respond(
-                f"✅ Phone number set: `{phone}`\n\n"
-                "When you use forwarding features, you'll receive a verification code via Telegram.\n"
-                "Just send it to the bot to authorize!"
+                "✅ **Session imported successfully!**\n\n"
+                f"📞 Phone: `+{me.phone}`\n"
+                f"👤 Name: {me.first_name}\n\n"
+                "You can now use all forwarding features!"
             )
-        except Exception as e:
-            await event.respond(f"❌ Error: {str(e)}\nPlease try again.")
-        return
-    
-    # Handle session string input
-    if session.mode == 'awaiting_session_string':
-        try:
-            session_str = event.message.text.strip()
-            
-            # Test the session string
-            test_client = TelegramClient(StringSession(session_str), API_ID, API_HASH)
-            await test_client.connect()
-            
-            if await test_client.is_user_authorized():
-                me = await test_client.get_me()
-                session.session_string = session_str
-                session.user_phone = me.phone
-                save_session(event.sender_id)
-                session.mode = 'idle'
-                
-                # Store in user_clients
-                user_clients[event.sender_id] = test_client
-                
-                await event.respond(
-                    "✅ **Session imported successfully!**\n\n"
-                    f"📞 Phone: `+{me.phone}`\n"
-                    f"👤 Name: {me.first_name}\n\n"
-                    "You can now use all forwarding features!"
-                )
-            else:
-                await test_client.disconnect()
-                await event.respond(
-                    "❌ Session string is invalid or expired.\n\n"
-                    "Please check your session string and try again."
-                )
-                session.mode = 'idle'
-        except Exception as e:
+        else:
+            await test_client.disconnect()
             await event.respond(
-                f"❌ Error importing session: {str(e)}\n\n"
-                "Please make sure you're using a valid session string."
+                "❌ Session string is invalid or expired.\n\n"
+                "Please check your session string and try again."
             )
-            session.mode = 'idle'
+            session.set_mode('idle')
+    except Exception as e:
+        await event.respond(
+            f"❌ Error importing session: {str(e)}\n\n"
+            "Please make sure you're using a valid session string."
+        )
+        session.set_mode('idle')
+
+async def handle_auth_code_input(event, session):
+    """Finish the user client login with the code Telegram sent"""
+    try:
+        code = event.message.text.strip().replace(' ', '').replace('-', '')
+        
+        client = client_pool.peek(event.sender_id)
+        if client is None:
+            await event.respond("❌ Session expired. Please try the operation again.")
+            session.set_mode('idle')
+            return
+        
+        await client.sign_in(session.user_phone, code)
+        
+        # Save session string
+        session.session_string = client.session.save()
+        session.set_mode('idle')
+        save_session(event.sender_id)
+        
+        await event.respond(
+            "✅ **Authorization successful!**\n\n"
+            "🔐 Your session has been saved securely.\n"
+            "You can now use all forwarding features!\n\n"
+            f"🔑 Session String (save this!):\n`{session.session_string}`\n\n"
+            "💡 Keep this string safe - you can use it to restore your session."
+        )
+        
+    except Exception as e:
+        await event.respond(
+            f"❌ Authorization failed: {str(e)}\n\n"
+            "Please try again or check your code."
+        )
+        session.set_mode('idle')
+
+# Handlers for the modes that wait for the user's next message
+AWAITING_HANDLERS = {
+    'awaiting_source': handle_source_input,
+    'awaiting_target': handle_target_input,
+    'awaiting_add_target': handle_target_input,
+    'awaiting_range': handle_range_input,
+    'awaiting_till_msg': handle_till_msg_input,
+    'awaiting_till_file': handle_till_file_input,
+    'awaiting_phone': handle_phone_input,
+    'awaiting_session_string': handle_session_string_input,
+    'awaiting_auth_code': handle_auth_code_input,
+}
+
+@bot.on(events.NewMessage(func=lambda event: event.is_private))
+async def message_handler(event):
+    """Pass a private message to the handler of the sender's awaiting mode"""
+    # Only idle sessions are left unloaded, so a sender without one has nothing to handle
+    session = user_sessions.get(event.sender_id)
+    if session is None:
         return
-    
-    # Handle authorization code input
-    if session.mode == 'awaiting_auth_code':
-        try:
-            code = event.message.text.strip().replace(' ', '').replace('-', '')
-            
-            if event.sender_id not in user_clients:
-                await event.respond("❌ Session expired. Please try the operation again.")
-                session.mode = 'idle'
-                return
-            
-            client = user_clients[event.sender_id]
-            await client.sign_in(session.user_phone, code)
-            
-            # Save session string
-            session.session_string = client.session.save()
-            session.mode = 'idle'
-            save_session(event.sender_id)
-            
-            await event.respond(
-                "✅ **Authorization successful!**\n\n"
-                "🔐 Your session has been saved securely.\n"
-                "You can now use all forwarding features!\n\n"
-                f"🔑 Session String (save this!):\n`{session.session_string}`\n\n"
-                "💡 Keep this string safe - you can use it to restore your session."
-            )
-            
-        except Exception as e:
-            await event.respond(
-                f"❌ Authorization failed: {str(e)}\n\n"
-                "Please try again or check your code."
-            )
-            session.mode = 'idle'
+    handler = AWAITING_HANDLERS.get(session.mode)
+    if handler is None or not is_admin(event.sender_id):
         return
+    await handler(event, session)
 
-async def forward_message_range(user_id, start_id, end_id=None):
+async def forward_message_range(user_id, start_id, end_id=None, job=None):
     """Forward messages in a range"""
     session = get_session(user_id)
-    session.stop_forwarding = False  # Reset stop flag
+    job = job or new_job(user_id, 'range', start_id=start_id, end_id=end_id)
     
     try:
         # Get appropriate client for fetching
         fetch_client = await get_client_for_fetching(user_id)
         
         if not fetch_client:
+            if job.job_id is not None:
+                job.finish('failed')
             return  # Error message already sent
         
-        source = await fetch_client.get_entity(session.source_channel)
-        target = await bot.get_entity(session.target_channel)
+        source, bot_source, targets = await resolve_bulk_peers(fetch_client, session, job)
         
-        forwarded = 0
-        async for message in fetch_client.iter_messages(source, min_id=start_id-1, max_id=end_id, reverse=True):
-            # Check if user wants to stop
-            if session.stop_forwarding:
-                await bot.send_message(user_id, "⏸️ Forwarding stopped by user!")
-                session.stop_forwarding = False
-                break
-                
-            try:
-                # Forward message (simple and reliable for all media types)
-                await bot.forward_messages(target, message.id, source)
-                    
-                forwarded += 1
-                session.forward_count += 1
-                
-                if forwarded % 10 == 0:
-                    await asyncio.sleep(1)  # Prevent flood
-                    
-            except FloodWaitError as e:
-                logger.warning(f"Flood wait: {e.seconds} seconds")
-                await asyncio.sleep(e.seconds)
-            except Exception as e:
-                logger.error(f"Error forwarding message: {e}")
-                continue
+        await forward_message_batches(
+            job, bot_source, targets,
+            fetch_client.iter_messages(
+                source, min_id=max(start_id - 1, job.last_id), max_id=end_id, reverse=True
+            ),
+            reporter=ProgressReporter(
+                job, f"📤 Forwarding messages {start_id}-{end_id or 'latest'}",
+                end_id=end_id or await latest_message_id(fetch_client, source)
+            ),
+            fetch_client=fetch_client
+        )
         
         save_session(user_id)
-        await bot.send_message(user_id, f"✅ Forwarded {forwarded} messages!")
+        await bot.send_message(
+            user_id,
+            f"✅ Forwarded {job.forwarded} messages!\n"
+            f"❌ Failed: {job.failed}\n"
+            f"⏭ Already forwarded: {job.skipped}\n"
+            + (f"🚫 Filtered by rules: {job.filtered}\n" if job.filtered else "")
+            + f"⚡ Speed: {format_rate(job.run_forwarded, job.elapsed)}"
+            + format_copy_stats(job)
+            + (f"\n\n🎯 Per target:\n{format_target_stats(job.target_stats)}" if len(job.target_stats) > 1 else "")
+        )
         
     except Exception as e:
+        if isinstance(e, ENTITY_ERRORS):
+            entity_cache.invalidate(session.source_channel)
+        job.finish('failed')
         logger.error(f"Error in forward_message_range: {e}")
         await bot.send_message(user_id, f"❌ Error: {str(e)}")
 
-async def forward_files(user_id, file_count):
-    """Forward specific number of files"""
+async def merge_by_id(streams):
+    """Merge ascending message iterators into one ascending stream without duplicates"""
+    iterators = [stream.__aiter__() for stream in streams]
+    heads = []
+    for index, iterator in enumerate(iterators):
+        message = await anext(iterator, None)
+        if message is not None:
+            heapq.heappush(heads, (message.id, index, message))
+    
+    last_id = None
+    while heads:
+        msg_id, index, message = heapq.heappop(heads)
+        if msg_id != last_id:
+            yield message
+            last_id = msg_id
+        message = await anext(iterators[index], None)
+        if message is not None:
+            heapq.heappush(heads, (message.id, index, message))
+
+def iter_media(fetch_client, source, media_type, min_id=0):
+    """Iterate media messages oldest first, letting Telegram do the filtering.
+    
+    'all' merges one filtered search per media type, so only matching
+    messages are ever fetched.
+    """
+    if media_type == 'all':
+        filters = [search_filter for _, search_filter in MEDIA_FILTERS.values()]
+    else:
+        filters = [MEDIA_FILTERS[media_type][1]]
+    streams = [
+        fetch_client.iter_messages(source, min_id=min_id, reverse=True, filter=search_filter)
+        for search_filter in filters
+    ]
+    return streams[0] if len(streams) == 1 else merge_by_id(streams)
+
+async def forward_files(user_id, file_count, job=None, media_type='all'):
+    """Forward specific number of files (0 for all) of one media type or of any type"""
     session = get_session(user_id)
-    session.stop_forwarding = False  # Reset stop flag
+    job = job or new_job(user_id, 'files', file_count=file_count, media_type=media_type)
     
     try:
         # Get appropriate client for fetching
         fetch_client = await get_client_for_fetching(user_id)
         
         if not fetch_client:
+            if job.job_id is not None:
+                job.finish('failed')
             return  # Error message already sent
         
-        source = await fetch_client.get_entity(session.source_channel)
-        target = await bot.get_entity(session.target_channel)
+        source, bot_source, targets = await resolve_bulk_peers(fetch_client, session, job)
         
-        forwarded = 0
-        async for message in fetch_client.iter_messages(source, reverse=True):
-            # Check if user wants to stop
-            if session.stop_forwarding:
-                await bot.send_message(user_id, "⏸️ Forwarding stopped by user!")
-                session.stop_forwarding = False
-                break
-                
-            if message.media and forwarded < file_count:
-                try:
-                    # Forward message (simple and reliable for all media types)
-                    await bot.forward_messages(target, message.id, source)
-                    forwarded += 1
-                    session.forward_count += 1
-                    
-                    if forwarded % 5 == 0:
-                        await asyncio.sleep(1)
-                        
-                except FloodWaitError as e:
-                    await asyncio.sleep(e.seconds)
-                except Exception as e:
-                    logger.error(f"Error forwarding file: {e}")
-                    continue
-            
-            if forwarded >= file_count:
-                break
+        await forward_message_batches(
+            job, bot_source, targets,
+            iter_media(fetch_client, source, media_type, min_id=job.last_id),
+            limit=file_count - job.processed if file_count else None,
+            reporter=ProgressReporter(
+                job, f"📤 Forwarding {MEDIA_FILTERS[media_type][0] if media_type in MEDIA_FILTERS else 'files'}",
+                total=file_count or None
+            ),
+            fetch_client=fetch_client
+        )
         
         save_session(user_id)
-        await bot.send_message(user_id, f"✅ Forwarded {forwarded} files!")
+        await bot.send_message(
+            user_id,
+            f"✅ Forwarded {job.forwarded} files!\n"
+            f"❌ Failed: {job.failed}\n"
+            f"⏭ Already forwarded: {job.skipped}\n"
+            + (f"🚫 Filtered by rules: {job.filtered}\n" if job.filtered else "")
+            + f"⚡ Speed: {format_rate(job.run_forwarded, job.elapsed)}"
+            + format_copy_stats(job)
+            + (f"\n\n🎯 Per target:\n{format_target_stats(job.target_stats)}" if len(job.target_stats) > 1 else "")
+        )
         
     except Exception as e:
+        if isinstance(e, ENTITY_ERRORS):
+            entity_cache.invalidate(session.source_channel)
+        job.finish('failed')
         logger.error(f"Error in forward_files: {e}")
         await bot.send_message(user_id, f"❌ Error: {str(e)}")
 
+def run_bulk_job(job):
+    """Return the coroutine that carries out a bulk job"""
+    if job.kind == 'all':
+        return forward_all_messages(job.user_id, job=job)
+    if job.kind == 'range':
+        return forward_message_range(job.user_id, job.params['start_id'], job.params['end_id'], job=job)
+    if job.kind == 'files':
+        return forward_files(
+            job.user_id, job.params['file_count'], job=job, media_type=job.params.get('media_type', 'all')
+        )
+    raise ValueError(f"Unknown job kind: {job.kind}")
+
+def describe_submission(position):
+    """Tell the user whether a submitted job started or was queued"""
+    if position:
+        return f"🕒 Queued at position {position}, it will start when a slot is free."
+    return "🚀 Started in the background. Use ⏸️ Stop Forwarding to cancel."
+
+PLAN_SAMPLE_SIZE = 50  # Recent media messages whose sizes estimate the average file size
+
+async def plan_job(user_id, kind, **params):
+    """Estimate a bulk job without reading its history: messages, media, bytes, API calls and ETA.
+    
+    Uses one history call for the message count and newest ID, one search
+    counters call for media counts and two small samples for file sizes.
+    Range counts are scaled from the whole channel by message ID, so they are
+    estimates. Returns the plan text, or None if the user client is not ready.
+    """
+    session = get_session(user_id)
+    fetch_client = await get_client_for_fetching(user_id)
+    if not fetch_client:
+        return None
+    source = await entity_cache.get(fetch_client, session.source_channel)
+    
+    latest = await fetch_client.get_messages(source, limit=1)
+    total = latest.total or 0
+    latest_id = latest[0].id if latest else 0
+    # The history call returns the channel too; one that restricts forwarding is copied instead
+    protected = bool(getattr(getattr(latest[0], 'chat', None), 'noforwards', False)) if latest else False
+    if kind == 'range':
+        start_id = max(1, params.get('start_id') or 1)
+        end_id = min(params.get('end_id') or latest_id, latest_id)
+        share = max(0, end_id - start_id + 1) / latest_id if latest_id else 0.0
+        span = f"messages {start_id}-{end_id}"
+    else:
+        share = 1.0
+        span = "the whole channel"
+    
+    filters = [search_filter for _, search_filter in MEDIA_FILTERS.values()]
+    counters = await fetch_client(GetSearchCountersRequest(peer=source, filters=[f() for f in filters]))
+    media = {key: round(counter.count * share) for key, counter in zip(MEDIA_FILTERS, counters)}
+    messages = round(total * share)
+    
+    # Average file size from the newest photos/videos and documents
+    sizes = {}
+    for keys, search_filter in ((('photo', 'video', 'gif', 'round'), InputMessagesFilterPhotoVideo),
+                                (('document', 'audio', 'voice'), InputMessagesFilterDocument)):
+        sample = await fetch_client.get_messages(source, limit=PLAN_SAMPLE_SIZE, filter=search_filter)
+        known = [message.file.size for message in sample if message.file and message.file.size]
+        for key in keys:
+            sizes[key] = sum(known) / len(known) if known else 0
+    total_bytes = sum(count * sizes.get(key, 0) for key, count in media.items())
+    
+    # API calls and the time the limiters need for them at their current rates
+    targets = session.target_channels
+    pages = -(-messages // 100)
+    # Copies go out one message at a time; each file is downloaded and uploaded once in parts
+    sends_per_target = messages if protected else -(-messages // FORWARD_BATCH_SIZE)
+    sends = sends_per_target * len(targets)
+    file_parts = 2 * sum(
+        count * -(-int(sizes.get(key, 0)) // COPY_CHUNK_SIZE) for key, count in media.items()
+    ) if protected else 0
+    eta = 0.0
+    client_rate = sum(get_rate_limiter(token.client).rate for token in sender_bots)
+    for target in targets:
+        chat_id = await resolve_chat_id(target)
+        target_rate = sum(
+            min(get_rate_limiter(token.client).rate, get_rate_limiter(token.client, chat_id).rate)
+            for token in sender_bots
+        )
+        eta = max(eta, sends_per_target / target_rate)
+    eta = max(eta, sends / client_rate)
+    edits = int(eta // PROGRESS_EDIT_INTERVAL)
+    if protected:
+        transfer = "the source restricts forwarding, so each file is downloaded and re-uploaded"
+        calls = f"{sends} copies, {file_parts} file parts"
+        limits = "the current rate limits, plus download and upload time"
+    else:
+        transfer = "forwarded server-side, nothing is downloaded"
+        calls = f"{sends} forwards"
+        limits = "the current rate limits"
+    
+    media_lines = "\n".join(
+        f"  • {MEDIA_FILTERS[key][0]}: {count}" for key, count in media.items() if count
+    ) or "  • None"
+    return (
+        f"**🧮 Plan: {span}**\n\n"
+        f"📨 Messages: ~{messages}\n"
+        f"🗂 Media:\n{media_lines}\n"
+        f"💾 Media size: ~{total_bytes / 2 ** 20:.0f} MB ({transfer})\n"
+        f"📥 Targets: {len(targets)}\n"
+        f"📡 API calls: ~{pages + sends + file_parts + edits} "
+        f"({pages} history pages, {calls}, {edits} progress edits)\n"
+        f"⏱ ETA: ~{format_duration(eta)} at {limits}\n\n"
+        f"Already forwarded messages are skipped, which makes the job faster."
+    )
+
+async def show_plan(event, kind, **params):
+    """Show a job plan with Start/Cancel buttons and remember the job until confirmed"""
+    session = get_session(event.sender_id)
+    session.pending_job = (kind, params)
+    try:
+        text = await plan_job(event.sender_id, kind, **params)
+    except Exception as e:
+        logger.error(f"Error planning {kind} job: {e}")
+        text = f"⚠️ Could not estimate this job: {e}"
+    if text is None:
+        session.pending_job = None
+        return  # Authorization prompt already sent
+    buttons = [[Button.inline("✅ Start", b"plan_start"), Button.inline("❌ Cancel", b"plan_cancel")]]
+    await bot.send_message(event.sender_id, text, buttons=buttons)
+
+@bot.on(events.CallbackQuery(pattern=b"plan_start"))
+async def plan_start(event):
+    """Start the job shown in the plan"""
+    session = get_session(event.sender_id)
+    if not session.pending_job:
+        await event.answer("⚠️ This plan has expired, please choose the mode again.", alert=True)
+        return
+    kind, params = session.pending_job
+    session.pending_job = None
+    position = job_manager.submit(new_job(event.sender_id, kind, **params))
+    await event.answer("🚀 Starting...")
+    try:
+        await event.edit(f"{(await event.get_message()).text}\n\n{describe_submission(position)}")
+    except Exception:
+        pass
+
+@bot.on(events.CallbackQuery(pattern=b"plan_cancel"))
+async def plan_cancel(event):
+    """Discard the job shown in the plan"""
+    get_session(event.sender_id).pending_job = None
+    await event.answer("❌ Cancelled")
+    try:
+        await event.edit("❌ Job cancelled.", buttons=[[Button.inline("🔙 Back to Modes", b"modes")]])
+    except Exception:
+        pass
+
+def resume_jobs():
+    """Resubmit bulk jobs that were running or queued when the process stopped"""
+    jobs = config_store.load_jobs('running', 'queued')
+    for job in jobs:
+        logger.info(f"Resuming {job.kind} job {job.job_id} for user {job.user_id} after message {job.last_id}")
+        job_manager.submit(job)
+    return len(jobs)
+
+async def send_copy(client, target, message, rules=None):
+    """Send one message without the forward tag, with the caption rules applied"""
+    if rules is None:
+        text, entities = message.text or message.message or "", message.entities
+    else:
+        text, entities = rules.caption(message)
+    return await client.send_message(
+        target, text, file=message.media, buttons=message.buttons, formatting_entities=entities
+    )
+
+async def send_album_copy(client, target, messages, rules=None):
+    """Send album parts as one grouped message without the forward tag"""
+    captions = [rules.caption(message) if rules else (message.message or "", message.entities) for message in messages]
+    multi_media = [
+        InputSingleMedia(
+            media=utils.get_input_media(message.media),
+            random_id=helpers.generate_random_long(),
+            message=text,
+            entities=entities
+        )
+        for message, (text, entities) in zip(messages, captions)
+    ]
+    return await client(SendMultiMediaRequest(peer=target, multi_media=multi_media))
+
+async def dispatch_live(chat_id, messages, send):
+    """Run send(client, target, messages, rules) for every target of every live session subscribed to chat_id
+    
+    Messages are first narrowed to those passing the session's rules, and
+    targets that already received all of them are skipped. Each stage is
+    timed into live_latency.
+    """
+    received = time.time()
+    started = time.monotonic()
+    # Only sessions subscribed to this chat are looked at
+    subscribers = live_routes.get(chat_id)
+    if not subscribers:
+        return
+    posted = messages[0].date.timestamp() if getattr(messages[0], 'date', None) else received
+    live_latency.record('receive', max(0.0, received - posted))
+    live_latency.record('route', time.monotonic() - started)
+    
+    for user_id, session in list(subscribers.items()):
+        if session.mode != 'live':
+            continue  # Temporarily in another mode (e.g. awaiting input)
+        
+        rules = session.compiled_rules
+        selected = [message for message in messages if rules.matches(message)] if rules else messages
+        if not selected:
+            continue
+        targets = [
+            target_id for target_id in session.target_channels
+            if dedup_index.filter_new(target_id, chat_id, selected)
+        ]
+        
+        async def deliver(target_id):
+            started = time.monotonic()
+            await resolve_chat_id(target_id)
+            resolved = time.monotonic()
+            result = await send_via_bots(
+                target_id, lambda client, target: send(client, target, selected, rules), count=len(selected)
+            )
+            sent = time.monotonic()
+            live_latency.record('resolve', resolved - started)
+            live_latency.record('send', sent - resolved, target=target_id)
+            live_latency.record('total', max(0.0, time.time() - posted))
+            metrics.observe('forwarder_live_forward_seconds', sent - started)
+            return result
+        
+        results = await fan_out(targets, deliver)
+        persisting = time.monotonic()
+        for target_id, result in zip(targets, results):
+            counts = session.target_stats.setdefault(target_id, [0, 0])
+            if isinstance(result, Exception):
+                counts[1] += len(selected)
+                metrics.inc('forwarder_messages_failed_total', len(selected), user=user_id, mode='live')
+                if isinstance(result, ENTITY_ERRORS):
+                    entity_cache.invalidate(target_id)
+                logger.error(f"Error in live forward to {target_id}: {result}")
+            else:
+                counts[0] += len(selected)
+                session.forward_count += len(selected)
+                metrics.inc('forwarder_messages_forwarded_total', len(selected), user=user_id, mode='live')
+                dedup_index.add(target_id, chat_id, selected)
+        mark_session_dirty(user_id)
+        live_latency.record('persist', time.monotonic() - persisting)
+
 # Live mode handler - monitors source channels
-@bot.on(events.NewMessage())
+def is_live_source(event):
+    """Event filter: the chat is the source of at least one live session.
+    
+    Checked by Telethon before the handler is scheduled; live_routes is
+    read at call time, so sources added later are picked up.
+    """
+    return event.chat_id in live_routes
+
+@bot.on(events.NewMessage(func=is_live_source))
 async def live_forward_handler(event):
     """Handle live forwarding from source channels"""
-    if event.is_private:
-        return
+    if event.message.grouped_id:
+        return  # Album parts are sent together by live_album_handler
     
-    # Check all users with live mode enabled
-    for user_id, session in user_sessions.items():
-        if session.mode == 'live' and session.source_channel:
-            try:
-                # Check if message is from source channel
-                if event.chat_id == session.source_channel:
-                    target = await bot.get_entity(session.target_channel)
-                    
-                    # Forward without forward tag
-                    await bot.send_message(
-                        target,
-                        event.message.text or event.message.message or "",
-                        file=event.message.media,
-                        buttons=event.message.buttons,
-                        formatting_entities=event.message.entities
-                    )
-                    
-                    session.forward_count += 1
-                    save_session(user_id)
-                    
-            except Exception as e:
-                logger.error(f"Error in live forward: {e}")
-                continue
+    # Forward without forward tag
+    await dispatch_live(
+        event.chat_id, [event.message],
+        lambda client, target, messages, rules: send_copy(client, target, messages[0], rules)
+    )
+
+@bot.on(events.Album(func=is_live_source))
+async def live_album_handler(event):
+    """Forward a whole album from a source channel as one grouped send"""
+    await dispatch_live(event.chat_id, event.messages, send_album_copy)
 
 async def health_check(request):
     """Health check endpoint for Koyeb"""
     return web.Response(text="OK", status=200)
 
+async def metrics_handler(request):
+    """Prometheus metrics endpoint"""
+    pool = client_pool.stats()
+    uploads = upload_cache.stats()
+    gauges = [
+        ('forwarder_active_jobs', {}, len(job_manager.running)),
+        ('forwarder_queued_jobs', {}, len(job_manager.queue)),
+        ('forwarder_live_sessions', {}, sum(len(subscribers) for subscribers in live_routes.values())),
+        ('forwarder_loaded_sessions', {}, len(user_sessions)),
+        ('forwarder_client_pool_size', {}, pool['size']),
+        ('forwarder_client_pool_hits', {}, pool['hits']),
+        ('forwarder_client_pool_evictions', {}, pool['evictions']),
+        ('forwarder_client_connect_seconds_avg', {}, pool['connect_ms'] / 1000),
+        ('forwarder_upload_cache_size', {}, uploads['size']),
+        ('forwarder_upload_cache_hits', {}, uploads['hits']),
+        ('forwarder_upload_cache_misses', {}, uploads['misses']),
+        ('forwarder_upload_cache_refreshes', {}, uploads['refreshes']),
+        ('forwarder_upload_cache_saved_bytes', {}, uploads['saved_bytes']),
+    ]
+    for stage, values in live_latency.summary().items():
+        for quantile, value in zip(live_latency.QUANTILES, values):
+            gauges.append(('forwarder_live_latency_seconds', {'stage': stage, 'quantile': quantile}, value))
+    for job, _ in job_manager.running.values():
+        gauges.append((
+            'forwarder_job_messages_per_second',
+            {'job': job.job_id, 'user': job.user_id, 'mode': job.kind},
+            job.run_forwarded / job.elapsed if job.elapsed > 0 else 0.0
+        ))
+    return web.Response(
+        body=metrics.render(gauges).encode(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+    )
+
 async def start_web_server():
-    """Start HTTP server for health checks"""
+    """Start HTTP server for health checks and metrics"""
     app = web.Application()
     app.router.add_get('/', health_check)
     app.router.add_get('/health', health_check)
+    app.router.add_get('/metrics', metrics_handler)
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, '0.0.0.0', 8000)
@@ -908,6 +3577,12 @@ async def main():
     """Start the bot and web server"""
     logger.info("Starting bot...")
     
+    # Restore live routes before the first update can arrive
+    hydrate_sessions()
+    started = time.monotonic()
+    count = dedup_index.load()
+    logger.info(f"Loaded {count} dedup keys in {(time.monotonic() - started) * 1000:.0f} ms")
+    
     # Connect bot with flood wait handling
     while True:
         try:
@@ -920,11 +3595,42 @@ async def main():
             logger.error(f"Error starting bot: {e}")
             await asyncio.sleep(5)
     
+    await start_sender_bots()
+    
     # Start health check server
     await start_web_server()
     
+    flusher = asyncio.create_task(session_flusher())
+    reaper = asyncio.create_task(client_reaper())
+    session_evictor = asyncio.create_task(session_reaper())
+    
+    # Pick up bulk jobs interrupted by the last shutdown
+    resume_jobs()
+    
+    if not HAS_CRYPTG:
+        logger.warning("cryptg is not installed; copying from channels with forwarding restricted will be CPU-bound")
     logger.info("Bot started!")
-    await bot.run_until_disconnected()
+    
+    # A container stop sends SIGTERM: disconnect so the cleanup below still runs
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.ensure_future(bot.disconnect()))
+    except NotImplementedError:
+        pass  # No signal handlers on this platform's event loop
+    try:
+        await bot.run_until_disconnected()
+    finally:
+        flusher.cancel()
+        reaper.cancel()
+        session_evictor.cancel()
+        job_manager.shutdown()
+        for job in list(active_jobs.values()):
+            job.checkpoint()  # Keep the job running so it resumes on next start
+        flush_sessions()
+        dedup_index.flush()
+        config_store.close()
+        await client_pool.close_all()
+        for token in sender_bots[1:]:
+            await token.client.disconnect()
 
 if __name__ == '__main__':
     asyncio.run(main())